@@ -0,0 +1,68 @@
+"""
+Measures the cost of reading ``request.pecan`` through
+``pecan.core.request``, comparing the current proxy and request class
+against the previous implementation, where both the proxy and ``WebOb``'s
+ad-hoc attributes were only reached after a failed attribute lookup, and
+against per-context state (as used for greenlets) set up with
+``set_context_ident``.
+
+Usage::
+
+    $ PYTHONPATH=. python benchmarks/context.py
+"""
+from thread import get_ident
+from timeit import Timer
+
+from webob import Request as WebObRequest
+
+from pecan import core
+
+
+def legacy_proxy(key):
+    class ObjectProxy(object):
+        def __getattr__(self, attr):
+            obj = getattr(core.state, key)
+            return getattr(obj, attr)
+        def __setattr__(self, attr, value):
+            obj = getattr(core.state, key)
+            return setattr(obj, attr, value)
+        def __delattr__(self, attr):
+            obj = getattr(core.state, key)
+            return delattr(obj, attr)
+    return ObjectProxy()
+
+
+def measure(label, func, number):
+    best = min(Timer(func).repeat(3, number))
+    print '%-16s %.3f usec/access' % (label, best * 1e6 / number)
+
+
+def main(number=500000):
+    legacy = legacy_proxy('request')
+    request = core.request
+
+    def run(label):
+        core.state.request = core.Request.blank('/')
+        core.state.request.pecan = {}
+        try:
+            measure(label, lambda: request.pecan, number)
+        finally:
+            del core.state.request
+
+    core.state.request = WebObRequest.blank('/')
+    core.state.request.pecan = {}
+    try:
+        measure('before', lambda: legacy.pecan, number)
+    finally:
+        del core.state.request
+    run('after')
+
+    core.set_context_ident(get_ident)
+    try:
+        run('per-context')
+    finally:
+        core.set_context_ident()
+
+
+if __name__ == '__main__':
+    main()
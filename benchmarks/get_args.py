@@ -0,0 +1,110 @@
+"""
+Measures the per-request cost of binding controller arguments in
+``Pecan.get_args``, comparing the precompiled ``ArgumentPlan`` against the
+previous implementation, which re-interpreted the raw ``argspec`` on every
+call.
+
+Usage::
+
+    $ PYTHONPATH=. python benchmarks/get_args.py
+"""
+from timeit import Timer
+
+import urllib
+
+from pecan import Pecan, expose
+from pecan.core import abort, request, state
+from pecan.util import _cfg
+
+
+class FakeRequest(object):
+    def __init__(self):
+        self.pecan = {}
+
+
+class RootController(object):
+    @expose()
+    def eater(self, id, dummy=None, other=None, *args, **kwargs):
+        pass
+
+
+app = Pecan(RootController())
+cfg = _cfg(RootController.eater)
+remainder = ['1', 'two', 'three', 'four']
+
+
+def params():
+    return dict(other='x', foo='bar', baz='buz', spam='eggs')
+
+
+def legacy_get_args(all_params, remainder, argspec, im_self):
+    args = []
+    kwargs = dict()
+    valid_args = argspec[0][1:]
+
+    def _decode(x):
+        return urllib.unquote_plus(x) if isinstance(x, basestring) else x
+
+    remainder = [_decode(x) for x in remainder]
+
+    if im_self is not None:
+        args.append(im_self)
+
+    if 'routing_args' in request.pecan:
+        remainder = request.pecan['routing_args'] + list(remainder)
+        del request.pecan['routing_args']
+
+    if valid_args and remainder:
+        args.extend(remainder[:len(valid_args)])
+        remainder = remainder[len(valid_args):]
+        valid_args = valid_args[len(args):]
+
+    if remainder:
+        if not argspec[1]:
+            abort(404)
+        args.extend(remainder)
+
+    if argspec[3]:
+        defaults = dict(zip(argspec[0][-len(argspec[3]):], argspec[3]))
+    else:
+        defaults = dict()
+
+    for name in valid_args:
+        if name in all_params:
+            args.append(all_params.pop(name))
+        elif name in defaults:
+            args.append(defaults[name])
+        else:
+            break
+
+    if argspec[2]:
+        for name, value in all_params.iteritems():
+            if name not in argspec[0]:
+                kwargs[name] = value
+
+    return args, kwargs
+
+
+def bind_argspec():
+    legacy_get_args(params(), remainder, cfg['argspec'], None)
+
+
+def bind_argplan():
+    app.get_args(params(), remainder, cfg['argplan'], None)
+
+
+def main(number=100000):
+    state.request = FakeRequest()
+    try:
+        assert legacy_get_args(params(), remainder, cfg['argspec'], None) == \
+            app.get_args(params(), remainder, cfg['argplan'], None)
+        for label, func in (('before', bind_argspec),
+                            ('after', bind_argplan)):
+            best = min(Timer(func).repeat(3, number))
+            print '%-8s %.2f usec/call' % (label, best * 1e6 / number)
+    finally:
+        del state.request
+
+
+if __name__ == '__main__':
+    main()
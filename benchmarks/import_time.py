@@ -0,0 +1,70 @@
+"""
+Reports how long each module takes to import, to help keep worker boot
+and ``pecan`` command startup fast.  Times are reported both for the
+module itself and including everything it imported in turn.
+
+Usage::
+
+    $ PYTHONPATH=. python benchmarks/import_time.py [module ...]
+
+Defaults to importing ``pecan``.
+"""
+from time import time
+
+import __builtin__
+import sys
+
+
+class ImportTimer(object):
+
+    def __init__(self):
+        self.stack = []
+        self.timings = {}
+        self._import = __builtin__.__import__
+
+    def __call__(self, name, *args, **kw):
+        if name in sys.modules:
+            return self._import(name, *args, **kw)
+
+        start = time()
+        self.stack.append(0.0)
+        try:
+            return self._import(name, *args, **kw)
+        finally:
+            children = self.stack.pop()
+            elapsed = time() - start
+            if self.stack:
+                self.stack[-1] += elapsed
+            if name in sys.modules and name not in self.timings:
+                self.timings[name] = (elapsed - children, elapsed)
+
+    def install(self):
+        __builtin__.__import__ = self
+
+    def uninstall(self):
+        __builtin__.__import__ = self._import
+
+    def report(self, limit=30, out=sys.stdout):
+        rows = sorted(
+            self.timings.items(),
+            key=lambda item: item[1][1],
+            reverse=True
+        )
+        out.write('%10s %10s  %s\n' % ('self (ms)', 'total (ms)', 'module'))
+        for name, (own, total) in rows[:limit]:
+            out.write('%10.2f %10.2f  %s\n' % (own * 1000, total * 1000, name))
+
+
+def main(modules):
+    timer = ImportTimer()
+    timer.install()
+    try:
+        for module in modules:
+            __import__(module)
+    finally:
+        timer.uninstall()
+    timer.report()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ['pecan'])
@@ -0,0 +1,113 @@
+"""
+Measures the cost of encoding a list of 100,000 objects of mixed types
+(``__json__`` objects, dates, Decimals, SQLAlchemy-style objects and
+MultiDicts) with ``pecan.jsonify.encode``, comparing the per-class dispatch
+and encoder caches against the previous implementation, which went through
+the generic function and the full chain of ``hasattr``/``isinstance``
+checks for every object.
+
+Usage::
+
+    $ PYTHONPATH=. python benchmarks/jsonify.py [count]
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from timeit import Timer
+
+import sys
+
+from simplegeneric import generic
+from webob.multidict import MultiDict, UnicodeMultiDict
+
+from pecan.jsonify import (encode, is_saobject, JSONEncoder, ResultProxy,
+                           RowProxy)
+
+
+class JsonObject(object):
+    def __init__(self, id):
+        self.id = id
+
+    def __json__(self):
+        return dict(id=self.id)
+
+
+class SAObject(object):
+    _sa_class_manager = object()
+
+    def __init__(self, id):
+        self._sa_instance_state = None
+        self.id = id
+        self.first_name = 'Jonathan'
+        self.last_name = 'LaCour'
+
+
+def make_objects(count):
+    objects = []
+    for i in range(count):
+        kind = i % 5
+        if kind == 0:
+            objects.append(JsonObject(i))
+        elif kind == 1:
+            objects.append(date(2011, 1, 1 + i % 28))
+        elif kind == 2:
+            objects.append(Decimal(i) / 100)
+        elif kind == 3:
+            objects.append(SAObject(i))
+        else:
+            objects.append(MultiDict(id=str(i)))
+    return objects
+
+
+class LegacyGenericJSON(JSONEncoder):
+    def default(self, obj):
+        if hasattr(obj, '__json__') and callable(obj.__json__):
+            return obj.__json__()
+        elif isinstance(obj, (date, datetime)):
+            return str(obj)
+        elif isinstance(obj, Decimal):
+            return float(obj)
+        elif is_saobject(obj):
+            props = {}
+            for key in obj.__dict__:
+                if not key.startswith('_sa_'):
+                    props[key] = getattr(obj, key)
+            return props
+        elif isinstance(obj, ResultProxy):
+            props = dict(rows=list(obj), count=obj.rowcount)
+            if props['count'] < 0:
+                props['count'] = len(props['rows'])
+            return props
+        elif isinstance(obj, RowProxy):
+            return dict(obj)
+        elif isinstance(obj, (MultiDict, UnicodeMultiDict)):
+            return obj.mixed()
+        else:
+            return JSONEncoder.default(self, obj)
+
+
+_legacy_default = LegacyGenericJSON()
+
+
+@generic
+def legacy_jsonify(obj):
+    return _legacy_default.default(obj)
+
+
+class LegacyGenericFunctionJSON(LegacyGenericJSON):
+    def default(self, obj):
+        return legacy_jsonify(obj)
+
+
+_legacy = LegacyGenericFunctionJSON()
+
+
+def main(count=100000):
+    objects = make_objects(count)
+    assert _legacy.encode(objects) == encode(objects)
+    for label, func in (('before', _legacy.encode), ('after', encode)):
+        best = min(Timer(lambda: func(objects)).repeat(3, 1))
+        print '%-8s %.3f sec for %d objects' % (label, best, count)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,173 @@
+"""
+Measures the cost of routing requests through nested ``RestController``
+resources, comparing the per-class dispatch tables against the previous
+implementation, which ran ``getargspec`` and probed for handlers with
+``getattr`` on every request.
+
+Usage::
+
+    $ PYTHONPATH=. python benchmarks/rest.py
+"""
+from inspect import getargspec, ismethod
+from timeit import Timer
+
+from webob import Request
+
+from pecan import expose
+from pecan.core import abort, request, state
+from pecan.rest import RestController
+from pecan.routing import lookup_controller
+from pecan.util import iscontroller
+
+
+class LegacyRouting(object):
+
+    @expose()
+    def _route(self, args):
+        method = self._get_method()
+        if request.method == 'GET' and method in ('delete', 'put'):
+            abort(405)
+        result = self._find_sub_controllers(args)
+        if result:
+            return result
+        handler = getattr(self, '_handle_%s' % method, self._handle_custom)
+        return handler(method, args)
+
+    def _find_controller(self, *args):
+        for name in args:
+            obj = getattr(self, name, None)
+            if obj and iscontroller(obj):
+                return obj
+        return None
+
+    def _find_sub_controllers(self, remainder):
+        method = None
+        for name in ('get_one', 'get'):
+            if hasattr(self, name):
+                method = name
+                break
+        if not method:
+            return
+        args = getargspec(getattr(self, method))
+        fixed_args = len(args[0][1:]) - len(request.pecan.get('routing_args', []))
+        var_args = args[1]
+        if var_args:
+            for i, item in enumerate(remainder):
+                controller = getattr(self, item, None)
+                if controller and not ismethod(controller):
+                    self._set_routing_args(remainder[:i])
+                    return lookup_controller(controller, remainder[i + 1:])
+        elif fixed_args < len(remainder) and hasattr(self, remainder[fixed_args]):
+            controller = getattr(self, remainder[fixed_args])
+            if not ismethod(controller):
+                self._set_routing_args(remainder[:fixed_args])
+                return lookup_controller(controller, remainder[fixed_args + 1:])
+
+    def _handle_get(self, method, remainder):
+        if not remainder:
+            controller = self._find_controller('get_all', 'get')
+            if controller:
+                return controller, []
+            abort(404)
+        method_name = remainder[-1]
+        if method_name in ('new', 'edit', 'delete'):
+            if method_name == 'delete':
+                method_name = 'get_delete'
+            controller = self._find_controller(method_name)
+            if controller:
+                return controller, remainder[:-1]
+        if method.upper() in self._custom_actions.get(method_name, []):
+            controller = self._find_controller('get_%s' % method_name, method_name)
+            if controller:
+                return controller, remainder[:-1]
+        controller = getattr(self, remainder[0], None)
+        if controller and not ismethod(controller):
+            return lookup_controller(controller, remainder[1:])
+        controller = self._find_controller('get_one', 'get')
+        if controller:
+            return controller, remainder
+        abort(404)
+
+
+def make_root(base):
+
+    class ChaptersController(base):
+        _custom_actions = {'publish': ['POST']}
+
+        @expose()
+        def get_all(self, author_id, book_id):
+            pass
+
+        @expose()
+        def get_one(self, author_id, book_id, id):
+            pass
+
+    class BooksController(base):
+        chapters = ChaptersController()
+
+        @expose()
+        def get_all(self, author_id):
+            pass
+
+        @expose()
+        def get_one(self, author_id, id):
+            pass
+
+    class AuthorsController(base):
+        books = BooksController()
+
+        @expose()
+        def get_all(self):
+            pass
+
+        @expose()
+        def get_one(self, id):
+            pass
+
+    class RootController(object):
+        authors = AuthorsController()
+
+    return RootController()
+
+
+class LegacyRestController(LegacyRouting, RestController):
+    pass
+
+
+paths = [
+    '/authors',
+    '/authors/1',
+    '/authors/1/books',
+    '/authors/1/books/2',
+    '/authors/1/books/2/chapters/3'
+]
+
+
+requests = [
+    (Request.blank(path), path.split('/')[1:]) for path in paths
+]
+
+
+def route(root):
+    for req, remainder in requests:
+        req.environ['webob.adhoc_attrs'] = {'pecan': {}}
+        state.request = req
+        lookup_controller(root, remainder)
+
+
+def main(number=10000):
+    legacy = make_root(LegacyRestController)
+    current = make_root(RestController)
+    try:
+        for label, root in (('before', legacy), ('after', current)):
+            best = min(Timer(lambda: route(root)).repeat(5, number))
+            print '%-8s %.2f usec/request' % (
+                label,
+                best * 1e6 / (number * len(paths))
+            )
+    finally:
+        del state.request
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,7 @@
 '''
 '''
 
-from paste.cascade import Cascade
-from paste.errordocument import make_errordocument
-from paste.recursive import RecursiveMiddleware
-from paste.translogger import TransLogger
-from paste.urlparser import StaticURLParser
-from weberror.errormiddleware import ErrorMiddleware
-from weberror.evalexception import EvalException
-
-from core import abort, error_for, override_template, Pecan, redirect, render, request, response, ValidationException
+from core import abort, conditional, error_for, override_template, Pecan, redirect, render, request, response, ValidationException
 from decorators import expose
 from hooks import RequestViewerHook
 from templating import error_formatters
@@ -21,11 +13,42 @@ __all__ = [
     'make_app', 'Pecan', 'request', 'response', 'override_template', 'expose', 'conf', 'set_config' 
 ]
 
-def make_app(root, static_root=None, debug=False, errorcfg={}, wrap_app=None, logging=False, **kw):
+def make_app(root, static_root=None, debug=False, errorcfg={}, wrap_app=None, logging=False, compression=False, **kw):
     '''
     
     '''
 
+    # middleware is imported here, rather than at module level, so that
+    # importing pecan (e.g., for the ``pecan`` command) stays cheap
+    from paste.errordocument import make_errordocument
+    from paste.recursive import RecursiveMiddleware
+    from paste.translogger import TransLogger
+    from weberror.errormiddleware import ErrorMiddleware
+    from weberror.evalexception import EvalException
+    from compression import CompressionMiddleware
+    from static import StaticFileMiddleware
+
+    if 'template_options' not in kw and hasattr(conf.app, 'template_options'):
+        kw['template_options'] = dict(
+            (name, dict(options))
+            for name, options in dict(conf.app.template_options).items()
+        )
+
+    # only watch templates for changes while developing
+    kw.setdefault('template_reload', getattr(conf.app, 'template_reload', debug))
+    kw.setdefault('json_backend', getattr(conf.app, 'json_backend', None))
+    kw.setdefault('output_cache', getattr(conf.app, 'output_cache', None))
+    kw.setdefault('etag', getattr(conf.app, 'etag', False))
+    kw.setdefault('permission_cache', getattr(conf.app, 'permission_cache', None))
+    static_options = dict(
+        kw.pop('static_options', getattr(conf.app, 'static_options', {}))
+    )
+    # precompressed copies of static files are sent where compression is
+    static_options.setdefault(
+        'precompressed',
+        isinstance(compression, dict) or compression == True
+    )
+
     app = Pecan(root, **kw)
     if wrap_app:
         app = wrap_app(app)
@@ -36,7 +59,9 @@ def make_app(root, static_root=None, debug=False, errorcfg={}, wrap_app=None, lo
         app = ErrorMiddleware(app, **errorcfg)
     app = make_errordocument(app, conf, **conf.app.errors)
     if static_root:
-        app = Cascade([StaticURLParser(static_root), app])
+        app = StaticFileMiddleware(app, static_root, **static_options)
+    if isinstance(compression, dict) or compression == True:
+        app = CompressionMiddleware(app, **(isinstance(compression, dict) and compression or {}))
     if isinstance(logging, dict) or logging == True:
         app = TransLogger(app, **(isinstance(logging, dict) and logging or {}))
     if hasattr(conf, 'requestviewer'):
@@ -0,0 +1,388 @@
+from StringIO import StringIO
+from threading import local
+from types import GeneratorType
+
+import sys
+
+from paste.recursive import ForwardRequestException
+from webob import Response, exc
+
+import core
+from core import Pecan, Request
+from routing import NotFound
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # pragma no cover
+    asyncio = None
+
+__all__ = ['AsyncPecan']
+
+
+# the state of the request whose task is running on this thread's loop
+_running = local()
+
+
+def _coroutine(func):
+    if asyncio is None:  # pragma no cover
+        return func
+    return asyncio.coroutine(func)
+
+
+if asyncio is not None:
+
+    class _RequestTask(asyncio.Task):
+        '''
+        A task which binds its request's state (``request``, ``response``
+        and so on) while it runs, and keeps any changes to it when it
+        waits. Tasks created while it runs, e.g., for the coroutines it
+        waits on, share its request's state.
+        '''
+
+        def __init__(self, coro, loop, values):
+            self._pecan_state = values
+            asyncio.Task.__init__(self, coro, loop=loop)
+
+        def _step(self, *args, **kw):
+            values = self._pecan_state
+            outer = getattr(_running, 'values', None)
+            _running.values = values
+            previous = core._swap_state(values)
+            try:
+                asyncio.Task._step(self, *args, **kw)
+            finally:
+                values[:] = core._swap_state(previous)
+                _running.values = outer
+
+
+def _task_factory(previous):
+    def create_task(loop, coro):
+        values = getattr(_running, 'values', None)
+        if values is not None:
+            return _RequestTask(coro, loop, values)
+        if previous is not None:
+            return previous(loop, coro)
+        return asyncio.Task(coro, loop=loop)
+    create_task.pecan = True
+    return create_task
+
+
+def _run_with_state(values, controller, args, kwargs):
+    # runs in the thread pool, with the state handed over by the task
+    previous = core._swap_state(values)
+    try:
+        return controller(*args, **kwargs)
+    finally:
+        values[:] = core._swap_state(previous)
+
+
+def _forwarded_environ(e, environ):
+    # ForwardRequestException describes the new request as middleware
+    forwarded = []
+    def capture(environ, start_response):
+        forwarded.append(environ)
+        return []
+    e.factory(capture)(dict(environ), None)
+    return forwarded[0]
+
+
+class AsyncPecan(Pecan):
+    '''
+    A Pecan application which runs on an ``asyncio`` event loop (using
+    ``trollius``, its port to Python 2), so that a single process can hold
+    thousands of requests open at once, e.g., for long polling.
+
+    Requests are routed, hooked and rendered just as they are by ``Pecan``.
+    Controllers and hook methods which are coroutines (decorated with
+    ``@asyncio.coroutine``) are waited on, while ordinary controllers are
+    run in a bounded pool of threads so that they never block the loop.
+    Each request runs in its own task, which binds the request's state (and
+    so ``request`` and ``response``) whenever it runs, and hands it over to
+    the thread an ordinary controller runs in. Coroutines waited on while
+    handling a request see its state too, as the application installs a
+    task factory on its event loop for them.
+
+    Requests are passed in with ``dispatch``, or through the ASGI-style
+    ``asgi`` entry point.
+
+    :param root: The root controller object.
+    :param max_threads: The number of threads ordinary controllers are run in.
+    :param loop: The event loop to use. Defaults to the current event loop.
+
+    Any other arguments are passed to ``Pecan``.
+    '''
+
+    def __init__(self, root, max_threads=10, loop=None, **kw):
+        if asyncio is None:
+            raise ImportError('AsyncPecan requires trollius')
+        Pecan.__init__(self, root, **kw)
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(max_threads)
+        factory = self.loop.get_task_factory()
+        if not getattr(factory, 'pecan', False):
+            self.loop.set_task_factory(_task_factory(factory))
+
+    @_coroutine
+    def dispatch(self, environ):
+        '''
+        Handles the request described by a WSGI ``environ``, returning the
+        response (a WSGI application) to send. This is a coroutine.
+
+        :param environ: The WSGI environ for the request. Its body must already be available from ``wsgi.input``.
+        '''
+
+        response = yield From(self._handle(environ))
+        raise Return(response)
+
+    def _handle(self, environ):
+        # the request runs in a task of its own, which starts out with no
+        # state and finishes with the response
+        values = [core._unset] * len(core._request_state)
+        return _RequestTask(self._forward(environ), self.loop, values)
+
+    @_coroutine
+    def _forward(self, environ):
+        while True:
+            try:
+                result = yield From(self._dispatch(environ))
+            except ForwardRequestException, e:
+                # an internal redirect, e.g., to a validation error handler
+                environ = _forwarded_environ(e, environ)
+            else:
+                raise Return(result)
+
+    @_coroutine
+    def _dispatch(self, environ):
+        state = core.state
+        state.request      = req = Request(environ)
+        state.response     = Response()
+        state.hooks        = []
+        state.app          = self
+        state.controller   = None
+        streamed = False
+
+        try:
+            try:
+                req.context = {}
+                req.pecan = dict(content_type=None, validation_errors={})
+
+                result = yield From(self.handle_request_async())
+            except Exception, e:
+                # kept, since other tasks run while the hooks are waited on
+                exc_info = sys.exc_info()
+                if isinstance(e, exc.HTTPException):
+                    state.response = e
+                if not isinstance(e, ForwardRequestException):
+                    yield From(self.handle_hooks_async('on_error', state, e))
+                if not isinstance(e, exc.HTTPException):
+                    raise exc_info[0], exc_info[1], exc_info[2]
+            else:
+                if result is NotFound:
+                    e = exc.HTTPNotFound()
+                    state.response = e
+                    yield From(self.handle_hooks_async('on_error', state, e))
+                elif isinstance(state.response.app_iter, GeneratorType):
+                    # streamed bodies are produced after the request is
+                    # handled, and run the "after" hooks once they're sent
+                    state.response.app_iter = core._StreamedBody(
+                        state.response.app_iter,
+                        [getattr(state, name) for name in core._request_state],
+                        environ
+                    )
+                    streamed = True
+            finally:
+                if not streamed:
+                    yield From(self.handle_hooks_async('after', state))
+
+            raise Return(state.response)
+        finally:
+            del state.hooks
+            del state.request
+            del state.response
+            del state.controller
+            del state.app
+
+    @_coroutine
+    def handle_request_async(self):
+        '''
+        Drives ``request_steps`` for the current request, waiting on hooks
+        and controllers. This is a coroutine.
+        '''
+
+        steps = self.request_steps()
+        step = steps.next()
+        while step[0] != 'done':
+            try:
+                if step[0] == 'hooks':
+                    result = yield From(
+                        self.handle_hooks_async(step[1], core.state)
+                    )
+                else:
+                    result = yield From(self.call_controller(*step[1:]))
+            except Exception:
+                step = steps.throw(*sys.exc_info())
+            else:
+                step = steps.send(result)
+        raise Return(step[1])
+
+    @_coroutine
+    def handle_hooks_async(self, hook_type, *args):
+        '''
+        Processes hooks of the specified type, waiting on any which return
+        a coroutine or future. This is a coroutine.
+
+        :param hook_type: The type of hook, including ``before``, ``after``, ``on_error``, and ``on_route``.
+        :param *args: Arguments to pass to the hooks.
+        '''
+
+        for hook in list(self.ordered_hooks(hook_type)):
+            result = getattr(hook, hook_type)(*args)
+            if asyncio.iscoroutine(result) or \
+                    isinstance(result, asyncio.Future):
+                yield From(result)
+
+    def handle_hooks(self, hook_type, *args):
+        '''
+        Processes hooks of the specified type without waiting on them, for
+        streamed bodies, whose ``after`` (and ``on_error``) hooks run as the
+        body is sent rather than in the request's task. Hook methods which
+        are coroutines are run in tasks of their own, which share the
+        request's state.
+
+        :param hook_type: The type of hook, including ``before``, ``after``, ``on_error``, and ``on_route``.
+        :param *args: Arguments to pass to the hooks.
+        '''
+
+        for hook in list(self.ordered_hooks(hook_type)):
+            result = getattr(hook, hook_type)(*args)
+            if asyncio.iscoroutine(result):
+                values = [
+                    getattr(core.state, name, core._unset)
+                    for name in core._request_state
+                ]
+                _RequestTask(result, self.loop, values)
+
+    @_coroutine
+    def call_controller(self, controller, args, kwargs):
+        '''
+        Calls a controller, waiting on it if it's a coroutine, and otherwise
+        running it in the thread pool. This is a coroutine.
+        '''
+
+        if asyncio.iscoroutinefunction(controller):
+            result = yield From(controller(*args, **kwargs))
+            raise Return(result)
+
+        # hand the request's state over to the thread the controller runs
+        # in, and take it back (with any changes) once it's done
+        values = core._swap_state([core._unset] * len(core._request_state))
+        try:
+            result = yield From(self.loop.run_in_executor(
+                self.executor,
+                _run_with_state,
+                values,
+                controller,
+                args,
+                kwargs
+            ))
+        finally:
+            core._swap_state(values)
+        raise Return(result)
+
+    @_coroutine
+    def asgi(self, scope, receive, send):
+        '''
+        An ASGI-style entry point. Handles the HTTP request described by
+        ``scope``, reading its body from ``http.request`` messages returned
+        by ``receive`` and sending the response as ``http.response.start``
+        and ``http.response.body`` messages with ``send``. This is a
+        coroutine.
+
+        :param scope: The connection scope, with the request's ``method``, ``path``, ``query_string`` and ``headers``.
+        :param receive: A coroutine returning the next message from the client.
+        :param send: A coroutine sending a message to the client.
+        '''
+
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported scope type %r' % scope['type'])
+
+        body = []
+        while True:
+            message = yield From(receive())
+            body.append(message.get('body', ''))
+            if not message.get('more_body'):
+                break
+
+        environ = self.make_environ(scope, ''.join(body))
+        response = yield From(self._handle(environ))
+
+        started = []
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+        app_iter = response(environ, start_response)
+
+        try:
+            status, headers = started
+            yield From(send({
+                'type'      : 'http.response.start',
+                'status'    : int(status.split(' ', 1)[0]),
+                'headers'   : [
+                    (name.lower(), value) for name, value in headers
+                ]
+            }))
+            if environ['REQUEST_METHOD'] != 'HEAD':
+                for chunk in app_iter:
+                    if chunk:
+                        yield From(send({
+                            'type'      : 'http.response.body',
+                            'body'      : chunk,
+                            'more_body' : True
+                        }))
+            yield From(send({'type': 'http.response.body', 'body': ''}))
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    def make_environ(self, scope, body):
+        '''
+        Builds a WSGI environ from an ASGI-style ``scope`` and the request
+        body.
+
+        :param scope: The connection scope.
+        :param body: The request body, as a string.
+        '''
+
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD'    : scope['method'],
+            'SCRIPT_NAME'       : scope.get('root_path', ''),
+            'PATH_INFO'         : scope['path'],
+            'QUERY_STRING'      : scope.get('query_string', ''),
+            'SERVER_NAME'       : server[0],
+            'SERVER_PORT'       : str(server[1]),
+            'SERVER_PROTOCOL'   : 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'CONTENT_LENGTH'    : str(len(body)),
+            'wsgi.version'      : (1, 0),
+            'wsgi.url_scheme'   : scope.get('scheme', 'http'),
+            'wsgi.input'        : StringIO(body),
+            'wsgi.errors'       : sys.stderr,
+            'wsgi.multithread'  : True,
+            'wsgi.multiprocess' : False,
+            'wsgi.run_once'     : False
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope.get('headers', []):
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_LENGTH':
+                # the body has already been read in full
+                continue
+            if key != 'CONTENT_TYPE':
+                key = 'HTTP_' + key
+            if key in environ:
+                environ[key] += ',' + value
+            else:
+                environ[key] = value
+        return environ
@@ -0,0 +1,113 @@
+from hashlib import sha1
+from time import time
+
+from util import LRUCache
+
+__all__ = ['MemoryCache', 'MemcachedCache']
+
+
+def _weigh(value):
+    if isinstance(value, basestring):
+        return len(value)
+    elif isinstance(value, (tuple, list)):
+        return sum(_weigh(item) for item in value) + 8 * len(value)
+    return 8
+
+
+class MemoryCache(LRUCache):
+    '''
+    An in-process cache for the output of ``@cached`` controllers, which
+    discards the least recently used entries once the output it holds
+    reaches ``maxbytes`` in total.
+
+    :param maxbytes: The approximate number of bytes of output to keep.
+    '''
+
+    def __init__(self, maxbytes=64 * 1024 * 1024):
+        LRUCache.__init__(self, maxbytes)
+        self.size = 0
+
+    def get(self, key, default=None):
+        entry = LRUCache.get(self, key)
+        if entry is None:
+            return default
+        expires, size, value = entry
+        if expires is not None and expires < time():
+            self.pop(key)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        size = _weigh(value)
+        if size > self.maxsize:
+            return
+        expires = ttl and time() + ttl or None
+        self._lock.acquire()
+        try:
+            link = self._links.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+                self.size -= link[self.VALUE][1]
+            while self._links and self.size + size > self.maxsize:
+                oldest = self._root[self.NEXT]
+                self._unlink(oldest)
+                del self._links[oldest[self.KEY]]
+                self.size -= oldest[self.VALUE][1]
+            link = [None, None, key, (expires, size, value)]
+            self._links[key] = link
+            self._append(link)
+            self.size += size
+        finally:
+            self._lock.release()
+
+    __setitem__ = set
+
+    def pop(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._links.pop(key, None)
+            if link is None:
+                return default
+            self._unlink(link)
+            self.size -= link[self.VALUE][1]
+            return link[self.VALUE][2]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        LRUCache.clear(self)
+        self.size = 0
+
+
+class MemcachedCache(object):
+    '''
+    Stores the output of ``@cached`` controllers in memcached, so that it
+    is shared by every process. Any client with memcached's ``get`` and
+    ``set`` API will do, e.g., a ``python-memcached`` or ``pylibmc``
+    ``Client``.
+
+    :param client: The memcached client.
+    :param prefix: A prefix for keys, to keep applications which share a memcached server apart.
+    '''
+
+    def __init__(self, client, prefix='pecan:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key):
+        # memcached keys are limited in length and character set
+        return self.prefix + sha1(key).hexdigest()
+
+    def get(self, key, default=None):
+        value = self.client.get(self._key(key))
+        if value is None:
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self._key(key), value, time=ttl or 0)
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self.client.delete(self._key(key))
+        return value
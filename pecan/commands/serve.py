@@ -4,6 +4,7 @@ PasteScript serve command for Pecan.
 from paste import httpserver
 from paste.script.serve import ServeCommand as _ServeCommand
 
+from pecan import prefork
 from base import Command
 
 import re
@@ -55,7 +56,22 @@ class ServeCommand(_ServeCommand, Command):
         _ServeCommand.command(self)
     
     def loadserver(self, server_spec, name, relative_to, **kw):
-        return (lambda app: httpserver.serve(app, self.config.server.host, self.config.server.port))
+        server = self.config.server
+        workers = int(getattr(server, 'workers', 0) or 0)
+        if workers:
+            return (lambda app: prefork.serve(
+                app,
+                server.host,
+                server.port,
+                workers=workers,
+                max_requests=int(getattr(server, 'max_requests', 0) or 0),
+                graceful_timeout=int(getattr(server, 'graceful_timeout', 30)),
+                loader=self.reload_app
+            ))
+        return (lambda app: httpserver.serve(app, server.host, server.port))
+    
+    def reload_app(self):
+        return self.load_app(self.load_configuration(self.args[0]))
     
     def loadapp(self, app_spec, name, relative_to, **kw):
         return self.load_app(self.config)
@@ -0,0 +1,235 @@
+from itertools import chain
+
+import zlib
+
+__all__ = ['CompressionMiddleware']
+
+
+# content types worth compressing; entries ending in "/" match a whole
+# family of types
+DEFAULT_CONTENT_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/x-javascript',
+    'application/xml',
+    'application/xhtml+xml',
+    'application/rss+xml',
+    'application/atom+xml',
+    'image/svg+xml'
+)
+
+# window sizes which make zlib produce each HTTP content coding
+_WBITS = {
+    'gzip'      : 16 + zlib.MAX_WBITS,
+    'deflate'   : zlib.MAX_WBITS
+}
+
+
+def _strong(tag):
+    if tag.startswith('W/'):
+        return tag[2:]
+    return tag
+
+
+def _weaken(headers):
+    return [
+        (name, value if name.lower() != 'etag' or value.startswith('W/')
+         else 'W/' + value)
+        for name, value in headers
+    ]
+
+
+def parse_accept_encoding(header):
+    '''
+    Returns the content codings from an ``Accept-Encoding`` header which
+    the client will accept, mapped to their quality values.
+
+    :param header: The value of the ``Accept-Encoding`` header.
+    '''
+    codings = {}
+    for part in (header or '').split(','):
+        params = part.strip().split(';')
+        coding = params[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class CompressionMiddleware(object):
+    '''
+    Compresses responses with ``gzip`` or ``deflate``, depending on what
+    the client's ``Accept-Encoding`` header allows. Responses without a
+    ``Content-Length`` (such as streamed ones) are compressed as they are
+    sent.
+
+    :param app: The WSGI application to wrap.
+    :param min_size: Responses smaller than this many bytes are sent uncompressed.
+    :param content_types: The content types to compress. Entries ending in a ``/`` match every type of that family, e.g., ``text/``.
+    :param level: The ``zlib`` compression level, from 1 (fastest) to 9 (smallest).
+    '''
+
+    def __init__(self, app, min_size=500, content_types=DEFAULT_CONTENT_TYPES,
+                 level=6):
+        self.app = app
+        self.min_size = min_size
+        self.content_types = tuple(content_types)
+        self.level = level
+
+    def compressible(self, content_type):
+        content_type = (content_type or '').split(';')[0].strip().lower()
+        for allowed in self.content_types:
+            if allowed.endswith('/'):
+                if content_type.startswith(allowed):
+                    return True
+            elif content_type == allowed:
+                return True
+        return False
+
+    def choose_coding(self, environ):
+        accepted = parse_accept_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        for coding in ('gzip', 'deflate'):
+            if accepted.get(coding, accepted.get('*', 0)) > 0:
+                return coding
+        return None
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return self.app(environ, start_response)
+
+        coding = self.choose_coding(environ)
+
+        # compressed responses carry weak ETags, which the client sends
+        # back; If-None-Match uses weak comparison, so they still match
+        weak_tags = False
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if coding and if_none_match and 'W/' in if_none_match:
+            weak_tags = True
+            environ = dict(environ)
+            environ['HTTP_IF_NONE_MATCH'] = ', '.join(
+                _strong(tag.strip()) for tag in if_none_match.split(',')
+            )
+
+        started = []
+        compression = []
+
+        def compressing_start_response(status, headers, exc_info=None):
+            started.append(status)
+            if weak_tags and status.startswith('304'):
+                return start_response(status, _weaken(headers), exc_info)
+            if not self.should_compress(status, headers):
+                return start_response(status, headers, exc_info)
+
+            # the response depends on Accept-Encoding, even if this client
+            # doesn't get it compressed
+            headers = [
+                (name, value) for name, value in headers
+                if name.lower() != 'vary'
+            ] + [('Vary', self.vary(headers))]
+            if not coding:
+                return start_response(status, headers, exc_info)
+
+            # streamed responses are flushed chunk by chunk, so that the
+            # client isn't kept waiting for compressed data
+            streaming = 'content-length' not in [
+                name.lower() for name, value in headers
+            ]
+            # the compressed bytes are a different representation, so the
+            # upstream ETag can't be used for ranges of them
+            headers = [
+                (name, value) for name, value in _weaken(headers)
+                if name.lower() not in ('content-length', 'accept-ranges')
+            ] + [('Content-Encoding', coding)]
+            compressor = zlib.compressobj(
+                self.level,
+                zlib.DEFLATED,
+                _WBITS[coding]
+            )
+            compression.append((compressor, streaming))
+            write = start_response(status, headers, exc_info)
+
+            def compressing_write(data):
+                write(compressor.compress(data) +
+                      compressor.flush(zlib.Z_SYNC_FLUSH))
+            return compressing_write
+
+        app_iter = self.app(environ, compressing_start_response)
+        if not started:
+            # the application may call start_response when its body is
+            # first iterated over, so nothing can be decided until then
+            return self.deferred(app_iter, environ, compression)
+        return self.finish(app_iter, environ, compression)
+
+    def finish(self, app_iter, environ, compression):
+        if not compression:
+            return app_iter
+        compressor, streaming = compression[-1]
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            # the headers say how the body would be sent, but there is none
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+            return []
+        return self.compress(app_iter, compressor, streaming)
+
+    def deferred(self, app_iter, environ, compression):
+        iterator = iter(app_iter)
+        try:
+            try:
+                first = [iterator.next()]
+            except StopIteration:
+                first = []
+            body = self.finish(chain(first, iterator), environ, compression)
+            for chunk in body:
+                yield chunk
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    def should_compress(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        content_type = length = None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return False
+            elif name == 'content-type':
+                content_type = value
+            elif name == 'content-length':
+                length = value
+        if not self.compressible(content_type):
+            return False
+        return length is None or int(length) >= self.min_size
+
+    def vary(self, headers):
+        vary = [
+            value.strip() for name, values in headers
+            if name.lower() == 'vary'
+            for value in values.split(',')
+        ]
+        if 'accept-encoding' not in [value.lower() for value in vary]:
+            vary.append('Accept-Encoding')
+        return ', '.join(vary)
+
+    def compress(self, app_iter, compressor, streaming):
+        try:
+            for chunk in app_iter:
+                data = compressor.compress(chunk)
+                if streaming:
+                    data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
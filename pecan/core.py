@@ -1,39 +1,86 @@
-from templating         import RendererFactory
-from routing            import lookup_controller, NonCanonicalPath
-from util               import _cfg, splitext
+from templating         import LayeredNamespace, RendererFactory
+from cache              import MemoryCache
+from hooks              import HookChain, PecanHook
+from routing            import lookup_controller, NonCanonicalPath, NotFound, RouteCache
+from util               import _cfg, splitext, ArgumentPlan, ContextLocal
 
-from webob              import Request, Response, exc
+from webob              import Request as WebObRequest, Response, exc
 from threading          import local
 from itertools          import chain
+from operator           import attrgetter
+from types              import GeneratorType
 from mimetypes          import guess_type, add_type
 from formencode         import htmlfill, Invalid, variabledecode
 from formencode.schema  import merge_dicts
 from paste.recursive    import ForwardRequestException
 
-try:
-    from simplejson import loads
-except ImportError: # pragma: no cover
-    from json import loads
-
+import sys
+import traceback
 import urllib
 
 # make sure that json is defined in mimetypes
 add_type('application/json', '.json', True)
 
-state = local()
+state = _thread_state = local()
+
+
+def set_context_ident(ident=None):
+    '''
+    Keeps the state of each request (and so ``request`` and ``response``)
+    separate for each context identified by ``ident``, rather than for each
+    thread, e.g., ``greenlet.getcurrent`` to serve requests from greenlets
+    without monkeypatching ``threading``. Call this once, before serving
+    any requests.
+    
+    :param ident: A function returning a hashable identifier for the current context, or ``None`` to go back to one context per thread.
+    '''
+    
+    global state
+    if ident is None:
+        state = _thread_state
+    else:
+        state = ContextLocal(ident)
+
+
+def _decode(x):
+    return urllib.unquote_plus(x) if isinstance(x, basestring) else x
+
+
+def _environ_attribute(key):
+    def fget(req):
+        try:
+            return req.environ[key]
+        except KeyError:
+            raise AttributeError(key)
+    def fset(req, value):
+        req.environ[key] = value
+    def fdel(req):
+        req.environ.pop(key, None)
+    return property(fget, fset, fdel)
+
+
+class Request(WebObRequest):
+    '''
+    The request object for Pecan applications. Pecan's own per-request
+    values are kept directly in the WSGI environ, rather than as ``WebOb``
+    ad-hoc attributes, which are only found after a failed lookup.
+    '''
+    
+    context = _environ_attribute('pecan.context')
+    pecan   = _environ_attribute('pecan.state')
 
 
 def proxy(key):
+    # every attribute goes straight to the current context's object, rather
+    # than through a failed lookup on the proxy first
     class ObjectProxy(object):
-        def __getattr__(self, attr):
-            obj = getattr(state, key)
-            return getattr(obj, attr)
+        __slots__ = ()
+        def __getattribute__(self, attr):
+            return getattr(getattr(state, key), attr)
         def __setattr__(self, attr, value):
-            obj = getattr(state, key)
-            return setattr(obj, attr, value)
+            return setattr(getattr(state, key), attr, value)
         def __delattr__(self, attr):
-            obj = getattr(state, key)
-            return delattr(obj, attr)
+            return delattr(getattr(state, key), attr)
     return ObjectProxy()
 
 
@@ -90,6 +137,41 @@ def redirect(location, internal=False, code=None, headers={}):
     raise exc.status_map[code](location=location, headers=headers)
 
 
+def conditional(etag=None, last_modified=None):
+    '''
+    Declares the version of the resource the current controller is about to
+    produce, as a cheap key such as a revision number or timestamp. If the
+    client already has that version (according to its ``If-None-Match`` or
+    ``If-Modified-Since`` headers), a ``304 Not Modified`` response is sent
+    straight away, without running the rest of the controller or rendering
+    its template.
+    
+    :param etag: A string identifying this version of the resource.
+    :param last_modified: The time this resource last changed, as a ``datetime`` or a timestamp.
+    '''
+    
+    if etag is not None:
+        response.etag = etag
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if request.method in ('GET', 'HEAD') and is_not_modified():
+        raise exc.HTTPNotModified()
+
+
+def is_not_modified():
+    '''
+    Returns ``True`` if the client already has the version of the resource
+    described by the response's ``ETag`` and ``Last-Modified`` headers.
+    '''
+    
+    # If-None-Match takes precedence over If-Modified-Since
+    if 'If-None-Match' in request.headers:
+        return response.etag is not None and response.etag in request.if_none_match
+    if request.if_modified_since is not None and response.last_modified is not None:
+        return response.last_modified <= request.if_modified_since
+    return False
+
+
 def error_for(field):
     '''
     A convenience function for fetching the validation error for a
@@ -131,6 +213,10 @@ def render(template, namespace):
     return state.app.render(template, namespace)
 
 
+# helpers made available to every template
+_template_helpers = dict(error_for=error_for, static=static)
+
+
 class ValidationException(ForwardRequestException):
     '''
     This exception is raised when a validation error occurs using Pecan's
@@ -157,6 +243,85 @@ class ValidationException(ForwardRequestException):
         ForwardRequestException.__init__(self, location)
 
 
+# the state of each request, which is bound again while a streamed body is
+# produced and closed, or while a request's task runs on an event loop
+_request_state = ('request', 'response', 'hooks', 'controller', 'app')
+_unset = object()
+
+
+def _swap_state(values):
+    '''
+    Binds the state of a request, given as a list of values in
+    ``_request_state`` order (``_unset`` for any which aren't set), and
+    returns the values it replaced in the same form.
+    '''
+
+    previous = [getattr(state, name, _unset) for name in _request_state]
+    for name, value in zip(_request_state, values):
+        if value is not _unset:
+            setattr(state, name, value)
+        elif hasattr(state, name):
+            delattr(state, name)
+    return previous
+
+
+class _StreamedBody(object):
+    '''
+    The body of a response which is produced as it is sent, e.g., by the
+    streaming ``json`` renderer. The request's state is bound again while
+    each chunk is produced, and the request's ``after`` hooks are only run
+    when the body is closed, so that anything they tear down (such as a
+    database transaction) is still usable while it's produced.
+
+    Errors are passed to the ``on_error`` hooks and logged to
+    ``wsgi.errors`` before the response is cut short, as the status and
+    headers have already been sent.
+    '''
+
+    def __init__(self, app_iter, values, environ):
+        self.app_iter = app_iter
+        self.values = values
+        self.environ = environ
+        self.closed = False
+
+    def __iter__(self):
+        iterator = iter(self.app_iter)
+        while True:
+            previous = _swap_state(self.values)
+            try:
+                chunk = iterator.next()
+            except StopIteration:
+                return
+            except Exception, e:
+                exc_info = sys.exc_info()
+                errors = self.environ.get('wsgi.errors', sys.stderr)
+                errors.write(
+                    'Error while streaming the response to %s; '
+                    'the response is incomplete\n' %
+                    self.environ.get('PATH_INFO')
+                )
+                traceback.print_exception(*exc_info, file=errors)
+                state.app.handle_hooks('on_error', state, e)
+                raise exc_info[0], exc_info[1], exc_info[2]
+            finally:
+                self.values = _swap_state(previous)
+            yield chunk
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        previous = _swap_state(self.values)
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            try:
+                state.app.handle_hooks('after', state)
+            finally:
+                self.values = _swap_state(previous)
+
+
 class Pecan(object):
     '''
     Base Pecan application object. Generally created using ``pecan.make_app``,
@@ -169,7 +334,15 @@ class Pecan(object):
                  hooks               = [],
                  custom_renderers    = {},
                  extra_template_vars = {},
-                 force_canonical     = True
+                 force_canonical     = True,
+                 route_cache_size    = 1000,
+                 notfound_cache_size = 1000,
+                 template_options    = {},
+                 template_reload     = True,
+                 json_backend        = None,
+                 output_cache        = None,
+                 etag                = False,
+                 permission_cache    = None
                  ):
         '''
         Creates a Pecan application instance, which is a WSGI application.
@@ -181,18 +354,54 @@ class Pecan(object):
         :param custom_renderers: Custom renderer objects, as a dictionary keyed by engine name.
         :param extra_template_vars: Any variables to inject into the template namespace automatically.
         :param force_canonical: A boolean indicating if this project should require canonical URLs.
+        :param route_cache_size: The number of routed paths to remember. Set to 0 to disable the route cache.
+        :param notfound_cache_size: The number of unroutable paths to remember. Set to 0 to disable caching of misses.
+        :param template_options: Options for template renderers, as a dictionary of keyword arguments keyed by engine name. Engines configured with ``precompile`` are loaded immediately.
+        :param template_reload: A boolean indicating if the builtin renderers should check template files for changes. Turn this off in production.
+        :param json_backend: The name of the JSON library used to encode JSON responses and decode JSON request bodies, e.g., 'json' or 'simplejson'. Defaults to simplejson, if it is installed.
+        :param output_cache: The cache used to store the output of controllers decorated with ``@cached``. Defaults to an in-process ``pecan.cache.MemoryCache``.
+        :param etag: A boolean indicating if every response should get an ``ETag`` computed from its body, so that conditional requests can be answered with ``304 Not Modified``. Individual controllers can opt in with ``@etag``.
+        :param permission_cache: A ``pecan.secure.PermissionCache`` used to share the results of permission checks between requests. By default, each check is made once per request.
         '''
 
+        from jsonify import get_backend
+        self.json_backend     = get_backend(json_backend)
+        if json_backend is not None:
+            # the json renderer encodes with the same backend
+            template_options = dict(template_options)
+            template_options['json'] = dict(
+                template_options.get('json', {}),
+                backend=json_backend
+            )
+
         self.root             = root
-        self.renderers        = RendererFactory(custom_renderers, extra_template_vars)
+        self.renderers        = RendererFactory(
+            custom_renderers,
+            extra_template_vars,
+            template_options,
+            template_reload
+        )
         self.default_renderer = default_renderer
         self.hooks            = hooks
         self.template_path    = template_path
         self.force_canonical  = force_canonical
+        self.route_cache      = RouteCache(route_cache_size, notfound_cache_size)
+        self.hook_chains      = {}
+        self.etag             = etag
+        self.permission_cache = permission_cache
+        self.output_cache     = output_cache
+        if output_cache is None:
+            self.output_cache = MemoryCache()
+        
+        # compile templates up front for engines that ask for it
+        for name, options in template_options.items():
+            if options.get('precompile'):
+                self.renderers.get(name, template_path)
         
     def route(self, node, path):
         '''
         Looks up a controller from a node based upon the specified path.
+        Returns ``NotFound`` as the controller if no controller matches.
         
         :param node: The node, such as a root controller object.
         :param path: The path to look up on this node.
@@ -200,7 +409,7 @@ class Pecan(object):
         
         path = path.split('/')[1:]
         try:
-            node, remainder = lookup_controller(node, path)
+            node, remainder = self.route_cache.lookup(node, path)
             return node, remainder
         except NonCanonicalPath, e:
             if self.force_canonical and not _cfg(e.controller).get('accept_noncanonical', False):
@@ -215,20 +424,37 @@ class Pecan(object):
     
     def determine_hooks(self, controller=None):
         '''
-        Determines the hooks to be run, in which order.
+        Determines the hooks to be run, in which order. The sorted chain
+        is computed once per controller and reused until the hooks are
+        changed or a hook's priority changes.
         
         :param controller: If specified, includes hooks for a specific controller.
         '''
         
+        cfg = None
         controller_hooks = []
         if controller:
-            controller_hooks = _cfg(controller).get('hooks', [])
-        return list(
-            sorted(
-                chain(controller_hooks, self.hooks), 
-                lambda x,y: cmp(x.priority, y.priority)
-            )
+            cfg = _cfg(controller)
+            controller_hooks = cfg.get('hooks', [])
+        
+        key = id(cfg)
+        # the cached chain holds on to its hooks, so their ids can't be reused
+        snapshot = tuple(map(id, controller_hooks)), tuple(map(id, self.hooks))
+        cached = self.hook_chains.get(key)
+        if cached is not None:
+            owner, app_hooks, ids, generation, hooks = cached
+            if owner is cfg and app_hooks is self.hooks and \
+                ids == snapshot and generation == PecanHook.generation:
+                return hooks
+        
+        hooks = HookChain(sorted(
+            chain(controller_hooks, self.hooks),
+            key=attrgetter('priority')
+        ))
+        self.hook_chains[key] = (
+            cfg, self.hooks, snapshot, PecanHook.generation, hooks
         )
+        return hooks
     
     def handle_hooks(self, hook_type, *args):
         '''
@@ -238,25 +464,38 @@ class Pecan(object):
         :param *args: Arguments to pass to the hooks.
         '''
         
-        if hook_type in ['before', 'on_route']:
-            hooks = state.hooks
-        else:
-            hooks = reversed(state.hooks)
-
-        for hook in hooks:
+        for hook in self.ordered_hooks(hook_type):
              getattr(hook, hook_type)(*args)
+    
+    def ordered_hooks(self, hook_type):
+        '''
+        Returns the current request's hooks in the order hooks of the
+        specified type run in.
+        
+        :param hook_type: The type of hook, including ``before``, ``after``, ``on_error``, and ``on_route``.
+        '''
+        
+        phases = getattr(state.hooks, 'phases', None)
+        if phases is not None:
+            return phases[hook_type]
+        elif hook_type in ['before', 'on_route']:
+            return state.hooks
+        else:
+            return reversed(state.hooks)
 
     def get_args(self, all_params, remainder, argspec, im_self):
         '''
         Determines the arguments for a controller based upon parameters
         passed the argument specification for the controller.
+        
+        :param argspec: Either the ``ArgumentPlan`` precompiled by ``expose``, or a plain ``argspec``.
         '''
+        if not isinstance(argspec, ArgumentPlan):
+            argspec = ArgumentPlan(argspec)
+        
         args = []
         kwargs = dict()
-        valid_args = argspec[0][1:]
-
-        def _decode(x):
-            return urllib.unquote_plus(x) if isinstance(x, basestring) else x
+        valid_args = argspec.positional
     
         remainder = [_decode(x) for x in remainder]
         
@@ -264,9 +503,9 @@ class Pecan(object):
             args.append(im_self)
         
         # grab the routing args from nested REST controllers
-        if 'routing_args' in request.pecan:
-            remainder = request.pecan['routing_args'] + list(remainder)
-            del request.pecan['routing_args']
+        pecan_state = state.request.pecan
+        if 'routing_args' in pecan_state:
+            remainder = pecan_state.pop('routing_args') + list(remainder)
         
         # handle positional arguments
         if valid_args and remainder:
@@ -276,17 +515,12 @@ class Pecan(object):
         
         # handle wildcard arguments
         if remainder:
-            if not argspec[1]:
+            if not argspec.varargs:
                 abort(404)
             args.extend(remainder)
         
-        # get the default positional arguments
-        if argspec[3]:
-            defaults = dict(zip(argspec[0][-len(argspec[3]):], argspec[3]))
-        else:
-            defaults = dict()
-        
         # handle positional GET/POST params
+        defaults = argspec.defaults
         for name in valid_args:
             if name in all_params:
                 args.append(all_params.pop(name))
@@ -296,23 +530,28 @@ class Pecan(object):
                 break
         
         # handle wildcard GET/POST params
-        if argspec[2]:
+        if argspec.varkw:
+            names = argspec.names
             for name, value in all_params.iteritems():
-                if name not in argspec[0]:
+                if name not in names:
                     kwargs[name] = value
         
         return args, kwargs
     
     def render(self, template, namespace):
         renderer = self.renderers.get(self.default_renderer, self.template_path)
-        if template == 'json':
+        helpers = template != 'json'
+        if not helpers:
             renderer = self.renderers.get('json', self.template_path)
-        else:
-            namespace['error_for'] = error_for
-            namespace['static'] = static
         if ':' in template:
             renderer = self.renderers.get(template.split(':')[0], self.template_path)
             template = template.split(':')[1]
+        if helpers:
+            if getattr(renderer, 'layered', False):
+                namespace = LayeredNamespace(_template_helpers, namespace)
+            else:
+                namespace['error_for'] = error_for
+                namespace['static'] = static
         return renderer.render(template, namespace)
     
     def validate(self, schema, params, json=False, error_handler=None, 
@@ -332,7 +571,7 @@ class Pecan(object):
         try:
             to_validate = params
             if json:
-                to_validate = loads(request.body)
+                to_validate = self.json_backend.loads(request.body)
             if variable_decode is not None:
                 to_validate = variabledecode.variable_decode(to_validate, **variable_decode)
             params = schema.to_python(to_validate)
@@ -350,66 +589,127 @@ class Pecan(object):
     
     def handle_request(self):
         '''
-        The main request handler for Pecan applications.
+        The main request handler for Pecan applications. Returns
+        ``NotFound`` if the request could not be routed to a controller.
         '''
         
+        steps = self.request_steps()
+        step = steps.next()
+        while step[0] != 'done':
+            try:
+                if step[0] == 'hooks':
+                    result = self.handle_hooks(step[1], state)
+                else:
+                    controller, args, kwargs = step[1:]
+                    result = controller(*args, **kwargs)
+            except Exception:
+                step = steps.throw(*sys.exc_info())
+            else:
+                step = steps.send(result)
+        return step[1]
+    
+    def request_steps(self):
+        '''
+        Handles the current request as a series of steps, so that it can be
+        driven either synchronously, by ``handle_request``, or from an event
+        loop, by ``pecan.asynchronous.AsyncPecan``. This generator yields
+        ``('hooks', hook_type)`` when hooks should run and ``('call',
+        controller, args, kwargs)`` when the controller should be called,
+        expecting the result (or exception) to be sent back, and finally
+        ``('done', result)``, where the result is ``NotFound`` if the request
+        could not be routed to a controller.
+        '''
+        
+        # the request is looked up once, rather than through the proxy on
+        # every access
+        req = state.request
+        pecan_state = req.pecan
+        
         # get a sorted list of hooks, by priority (no controller hooks yet)
         state.hooks = self.determine_hooks()
         
         # store the routing path to allow hooks to modify it
-        request.pecan['routing_path'] = request.path
+        pecan_state['routing_path'] = req.path
 
         # handle "on_route" hooks
-        self.handle_hooks('on_route', state)
+        yield 'hooks', 'on_route'
         
         # lookup the controller, respecting content-type as requested
         # by the file extension on the URI
-        path = request.pecan['routing_path']
+        path = pecan_state['routing_path']
 
-        if not request.pecan['content_type'] and '.' in path.split('/')[-1]:
+        if not pecan_state['content_type'] and '.' in path.split('/')[-1]:
             path, extension = splitext(path)
-            request.pecan['extension'] = extension
+            pecan_state['extension'] = extension
             # preface with a letter to ensure compat for 2.5
-            request.pecan['content_type'] = guess_type('x' + extension)[0]
+            pecan_state['content_type'] = guess_type('x' + extension)[0]
 
         controller, remainder = self.route(self.root, path)
+        if controller is NotFound:
+            yield 'done', NotFound
+            return
         cfg = _cfg(controller)
 
         if cfg.get('generic_handler'):
-            raise exc.HTTPNotFound
+            yield 'done', NotFound
+            return
         
         # handle generic controllers
         im_self = None
         if cfg.get('generic'):
             im_self = controller.im_self
             handlers = cfg['generic_handlers']
-            controller = handlers.get(request.method, handlers['DEFAULT'])
+            controller = handlers.get(req.method, handlers['DEFAULT'])
             cfg = _cfg(controller)
                     
         # add the controller to the state so that hooks can use it
         state.controller = controller
     
         # if unsure ask the controller for the default content type 
-        if not request.pecan['content_type']:
-            request.pecan['content_type'] = cfg.get('content_type', 'text/html')
+        if not pecan_state['content_type']:
+            pecan_state['content_type'] = cfg.get('content_type', 'text/html')
         elif cfg.get('content_type') is not None and \
-            request.pecan['content_type'] not in cfg.get('content_types', {}):
+            pecan_state['content_type'] not in cfg.get('content_types', {}):
 
             print "Controller '%s' defined does not support content_type '%s'. Supported type(s): %s" % (
                 controller.__name__,
-                request.pecan['content_type'],
+                pecan_state['content_type'],
                 cfg.get('content_types', {}).keys()
                 )
-            raise exc.HTTPNotFound
+            yield 'done', NotFound
+            return
         
         # get a sorted list of hooks, by priority
         state.hooks = self.determine_hooks(controller)
     
         # handle "before" hooks
-        self.handle_hooks('before', state)
+        yield 'hooks', 'before'
+        
+        # serve cached output without calling the controller at all
+        cache_key = None
+        if 'cache' in cfg and req.method in ('GET', 'HEAD'):
+            cache_key = self.output_cache_key(controller, cfg['cache'])
+            cached = self.output_cache.get(cache_key)
+            if cached is not None:
+                body, headers = cached
+                resp = state.response
+                # headers set by this request's "before" hooks are kept,
+                # unless the cached response sets them too
+                names = set(name.lower() for name, value in headers)
+                resp.headerlist = [
+                    header for header in resp.headerlist
+                    if header[0].lower() not in names
+                ] + list(headers)
+                resp.body = body
+                if is_not_modified():
+                    self.not_modified()
+                yield 'done', None
+                return
+            # only what the controller and renderer add is cached
+            hooked_headers = list(state.response.headerlist)
         
         # fetch and validate any parameters
-        params = dict(request.str_params)
+        params = dict(req.str_params)
         if 'schema' in cfg:
             params = self.validate(
                         cfg['schema'], 
@@ -419,68 +719,157 @@ class Pecan(object):
                         htmlfill=cfg.get('htmlfill'),
                         variable_decode=cfg.get('variable_decode')
                     )
-        elif 'pecan.validation_errors' in request.environ:
-            request.pecan['validation_errors'] = request.environ.pop('pecan.validation_errors')
+        elif 'pecan.validation_errors' in req.environ:
+            pecan_state['validation_errors'] = req.environ.pop('pecan.validation_errors')
         
         # fetch the arguments for the controller
         args, kwargs = self.get_args(
             params, 
             remainder,
-            cfg['argspec'],
+            cfg['argplan'],
             im_self
         )
         
         # get the result from the controller
-        result = controller(*args, **kwargs)
+        try:
+            result = yield 'call', controller, args, kwargs
+        except exc.HTTPNotModified:
+            # the controller called ``conditional`` and the client is
+            # already up to date, so there's nothing to render
+            self.not_modified()
+            yield 'done', None
+            return
 
         # a controller can return the response object which means they've taken 
         # care of filling it out
-        if result == response:
+        resp = state.response
+        if result == response or result is resp:
+            yield 'done', None
             return
 
         raw_namespace = result
 
         # pull the template out based upon content type and handle overrides
-        template = cfg.get('content_types', {}).get(request.pecan['content_type'])
+        template = cfg.get('content_types', {}).get(pecan_state['content_type'])
 
         # check if for controller override of template
-        template = request.pecan.get('override_template', template)
-        request.pecan['content_type'] = request.pecan.get('override_content_type', request.pecan['content_type'])
+        template = pecan_state.get('override_template', template)
+        pecan_state['content_type'] = pecan_state.get('override_content_type', pecan_state['content_type'])
 
         # if there is a template, render it
         if template:
             if template == 'json':
-                request.pecan['content_type'] = 'application/json'
+                pecan_state['content_type'] = 'application/json'
             result = self.render(template, result)
         
         # pass the response through htmlfill (items are popped out of the 
         # environment even if htmlfill won't run for proper cleanup)
         _htmlfill = cfg.get('htmlfill')
-        if _htmlfill is None and 'pecan.htmlfill' in request.environ:
-            _htmlfill = request.environ.pop('pecan.htmlfill')
-        if 'pecan.params' in request.environ:
-            params = request.environ.pop('pecan.params')
-        if request.pecan['validation_errors'] and _htmlfill is not None and request.pecan['content_type'] == 'text/html':
-            errors = request.pecan['validation_errors']
+        if _htmlfill is None and 'pecan.htmlfill' in req.environ:
+            _htmlfill = req.environ.pop('pecan.htmlfill')
+        if 'pecan.params' in req.environ:
+            params = req.environ.pop('pecan.params')
+        if pecan_state['validation_errors'] and _htmlfill is not None and pecan_state['content_type'] == 'text/html':
+            errors = pecan_state['validation_errors']
             result = htmlfill.render(result, defaults=params, errors=errors, text_as_default=True, **_htmlfill)
         
         # If we are in a test request put the namespace where it can be
         # accessed directly
-        if request.environ.get('paste.testing'):
-            testing_variables = request.environ['paste.testing_variables']
+        if req.environ.get('paste.testing'):
+            testing_variables = req.environ['paste.testing_variables']
             testing_variables['namespace'] = raw_namespace
             testing_variables['template_name'] = template
             testing_variables['controller_output'] = result
         
         # set the body content
         if isinstance(result, unicode):
-            response.unicode_body = result
+            resp.unicode_body = result
+        elif isinstance(result, GeneratorType):
+            # streaming renderers produce the body as it is sent
+            resp.app_iter = result
         else:
-            response.body = result
+            resp.body = result
         
         # set the content type
-        if request.pecan['content_type']:
-            response.content_type = request.pecan['content_type']
+        if pecan_state['content_type']:
+            resp.content_type = pecan_state['content_type']
+        
+        check_conditional = req.method in ('GET', 'HEAD') and \
+            resp.status_int == 200 and \
+            not isinstance(resp.app_iter, GeneratorType)
+        if check_conditional and resp.etag is None and \
+                (self.etag or cfg.get('etag')):
+            resp.md5_etag()
+        
+        if cache_key is not None:
+            self.store_output(cache_key, cfg['cache'], hooked_headers)
+        
+        if check_conditional and is_not_modified():
+            self.not_modified()
+        
+        yield 'done', None
+    
+    def not_modified(self):
+        '''
+        Turns the response to the current request into a ``304 Not
+        Modified``, keeping its headers but discarding its body.
+        '''
+        
+        response.status = 304
+        response.app_iter = []
+        response.content_length = None
+        if 'Content-Type' in response.headers:
+            del response.headers['Content-Type']
+    
+    def output_cache_key(self, controller, cache):
+        '''
+        Returns the key that the output of a ``@cached`` controller is stored
+        under for the current request, made up of the controller, the path,
+        the query string and any headers the output varies on.
+        
+        :param controller: The controller handling the request.
+        :param cache: The controller's ``@cached`` configuration.
+        '''
+        
+        return repr((
+            getattr(controller, '__module__', None),
+            getattr(controller, '__name__', None),
+            request.path,
+            sorted(request.GET.items()),
+            request.pecan['content_type'],
+            [request.headers.get(name) for name in cache['vary']]
+        ))
+    
+    def store_output(self, key, cache, hooked_headers=()):
+        '''
+        Stores the response to the current request in the output cache, if
+        it was successful and isn't being streamed.
+        
+        :param key: The key to store the response under.
+        :param cache: The controller's ``@cached`` configuration.
+        :param hooked_headers: The response's headers before the controller was called (e.g., set by ``before`` hooks), which are particular to this request and aren't stored.
+        '''
+        
+        if response.status_int != 200 or isinstance(response.app_iter, GeneratorType):
+            return
+        if cache['vary']:
+            vary = list(response.vary or [])
+            response.vary = vary + [
+                name for name in cache['vary'] if name not in vary
+            ]
+        # cookies belong to the user who caused the response to be cached
+        hooked_headers = list(hooked_headers)
+        headers = []
+        for header in response.headerlist:
+            if header in hooked_headers:
+                hooked_headers.remove(header)
+            elif header[0].lower() not in ('content-length', 'set-cookie'):
+                headers.append(header)
+        self.output_cache.set(
+            key,
+            (response.body, tuple(headers)),
+            cache['ttl']
+        )
     
     def __call__(self, environ, start_response):
         '''
@@ -488,19 +877,21 @@ class Pecan(object):
         '''
         
         # create the request and response object
-        state.request      = Request(environ)
+        req                = Request(environ)
+        state.request      = req
         state.response     = Response()
         state.hooks        = []
         state.app          = self
         state.controller   = None
         
         # handle the request
+        streamed = False
         try:
             # add context and environment to the request 
-            state.request.context = {}
-            state.request.pecan = dict(content_type=None, validation_errors={})
+            req.context = {}
+            req.pecan = dict(content_type=None, validation_errors={})
 
-            self.handle_request()
+            result = self.handle_request()
         except Exception, e:
             # if this is an HTTP Exception, set it as the response
             if isinstance(e, exc.HTTPException):
@@ -512,9 +903,26 @@ class Pecan(object):
             
             if not isinstance(e, exc.HTTPException):
                 raise
+        else:
+            # misses are reported by return value rather than by raising,
+            # so the 404 response is only built here
+            if result is NotFound:
+                e = exc.HTTPNotFound()
+                state.response = e
+                self.handle_hooks('on_error', state, e)
+            elif isinstance(state.response.app_iter, GeneratorType):
+                # streamed bodies are produced after the state is cleaned
+                # up, and run the "after" hooks themselves once they're sent
+                state.response.app_iter = _StreamedBody(
+                    state.response.app_iter,
+                    [getattr(state, name) for name in _request_state],
+                    environ
+                )
+                streamed = True
         finally:
             # handle "after" hooks
-            self.handle_hooks('after', state)
+            if not streamed:
+                self.handle_hooks('after', state)
             
         # get the response
         try:
@@ -525,3 +933,7 @@ class Pecan(object):
             del state.request
             del state.response
             del state.controller
+            if isinstance(state, ContextLocal):
+                # contexts such as greenlets are short-lived and numerous,
+                # so nothing is left behind for them
+                del state.app
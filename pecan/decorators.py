@@ -1,8 +1,8 @@
 from inspect import getargspec, getmembers, isclass, ismethod
-from util import _cfg
+from util import _cfg, ArgumentPlan
 
 __all__ = [
-    'expose', 'transactional', 'accept_noncanonical'
+    'expose', 'transactional', 'accept_noncanonical', 'cached', 'etag'
 ]
 
 
@@ -59,8 +59,10 @@ def expose(template        = None,
             cfg['generic_handlers'] = dict(DEFAULT=f)
             f.when = when_for(f)
             
-        # store the arguments for this controller method
+        # store the arguments for this controller method, along with a
+        # precompiled plan for binding them to each request
         cfg['argspec'] = getargspec(f)
+        cfg['argplan'] = ArgumentPlan(cfg['argspec'])
         
         # store the schema
         cfg['error_handler'] = error_handler
@@ -123,6 +125,34 @@ def after_commit(action):
     return deco
 
 
+def cached(ttl=300, vary=[]):
+    '''
+    Caches the rendered output of a controller method, so that repeat
+    ``GET`` requests for the same path and query string are answered without
+    calling the controller or rendering its template. Output is stored in
+    the application's ``output_cache``.
+    
+    :param ttl: The number of seconds to keep the output for.
+    :param vary: The names of any request headers the output also depends on, e.g., ``Accept-Language``.
+    '''
+    
+    def deco(func):
+        _cfg(func)['cache'] = dict(ttl=ttl, vary=tuple(vary))
+        return func
+    return deco
+
+
+def etag(func):
+    '''
+    Gives responses from a controller method an ``ETag`` computed from
+    their body, so that conditional requests can be answered with ``304
+    Not Modified``.
+    '''
+    
+    _cfg(func)['etag'] = True
+    return func
+
+
 def accept_noncanonical(func):
     '''
     Flags a controller method as accepting non-canoncial URLs.
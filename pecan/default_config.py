@@ -12,6 +12,7 @@ app = {
     'template_path' : '',
     'debug' : False,
     'force_canonical' : True,
+    'compression' : False,
     'errors' : {
         '__force_dict__' : True
     }
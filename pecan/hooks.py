@@ -5,7 +5,7 @@ from webob.exc import HTTPFound
 from util      import iscontroller, _cfg
 from routing   import lookup_controller
 
-__all__ = ['PecanHook', 'TransactionHook', 'HookController', 'RequestViewerHook']
+__all__ = ['PecanHook', 'TransactionHook', 'HookController', 'RequestViewerHook', 'HookChain']
 
 
 def walk_controller(root_class, controller, hooks):
@@ -45,6 +45,15 @@ class PecanHook(object):
     
     priority = 100
     
+    # bumped whenever any hook's priority changes, so that applications
+    # know to re-sort the hook chains they have cached
+    generation = 0
+    
+    def __setattr__(self, name, value):
+        if name == 'priority':
+            PecanHook.generation += 1
+        object.__setattr__(self, name, value)
+    
     def on_route(self, state):
         '''
         Override this method to create a hook that gets called upon
@@ -83,6 +92,38 @@ class PecanHook(object):
         return
 
 
+def implements(hook, hook_type):
+    '''
+    Determines whether a hook does any work for a given hook type, i.e.,
+    whether it overrides the empty implementation on ``PecanHook``.
+    '''
+    
+    if hook_type in getattr(hook, '__dict__', {}):
+        return True
+    method = getattr(type(hook), hook_type, None)
+    if method is None:
+        return True
+    return getattr(method, 'im_func', method) is not \
+        getattr(PecanHook, hook_type).im_func
+
+
+class HookChain(list):
+    '''
+    A priority-ordered list of hooks, along with the hooks to run for each
+    hook type in the order they should be run. Hooks which inherit the empty
+    ``PecanHook`` implementation for a hook type are left out of it.
+    '''
+    
+    def __init__(self, hooks=[]):
+        list.__init__(self, hooks)
+        self.phases = {}
+        for hook_type in ('on_route', 'before', 'after', 'on_error'):
+            phase = [hook for hook in self if implements(hook, hook_type)]
+            if hook_type in ('after', 'on_error'):
+                phase.reverse()
+            self.phases[hook_type] = phase
+
+
 class TransactionHook(PecanHook):
     '''
     A basic framework hook for supporting wrapping requests in
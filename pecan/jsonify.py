@@ -3,8 +3,15 @@ try:
 except ImportError: # pragma: no cover
     from json import JSONEncoder
 
+try:
+    import simplejson
+except ImportError: # pragma: no cover
+    simplejson = None
+import json
+
 from datetime               import datetime, date
 from decimal                import Decimal
+from operator               import methodcaller
 from webob.multidict        import MultiDict, UnicodeMultiDict
 from simplegeneric          import generic
 
@@ -31,34 +38,68 @@ def is_saobject(obj):
     return hasattr(obj, '_sa_class_manager')
 
 
+def _is_iterator(obj):
+    return hasattr(obj, 'next') and hasattr(obj, '__iter__')
+
+
+def _encode_json_method(obj):
+    return obj.__json__()
+
+
+def _encode_saobject(obj):
+    # every loaded attribute, including any which aren't mapped
+    props = {}
+    for key in obj.__dict__:
+        if not key.startswith('_sa_'):
+            props[key] = getattr(obj, key)
+    return props
+
+
+def _encode_result_proxy(obj):
+    props = dict(rows=list(obj), count=obj.rowcount)
+    if props['count'] < 0:
+        props['count'] = len(props['rows'])
+    return props
+
+
+def _resolve_encoder(obj):
+    if hasattr(obj, '__json__') and callable(obj.__json__):
+        return _encode_json_method
+    elif isinstance(obj, (date, datetime)):
+        return str
+    elif isinstance(obj, Decimal):
+          # XXX What to do about JSONEncoder crappy handling of Decimals?
+          # SimpleJSON has better Decimal encoding than the std lib
+          # but only in recent versions
+        return float
+    elif is_saobject(obj):
+        return _encode_saobject
+    elif isinstance(obj, ResultProxy):
+        return _encode_result_proxy
+    elif isinstance(obj, RowProxy):
+        return dict
+    elif _is_iterator(obj):
+        return list
+    elif isinstance(obj, (MultiDict, UnicodeMultiDict)):
+        return methodcaller('mixed')
+    return None
+
+
+# the encoding strategy for each class, which is resolved from the first
+# instance seen rather than re-checked for every object
+_encoders = {}
+
+
 class GenericJSON(JSONEncoder):
     def default(self, obj):
-        if hasattr(obj, '__json__') and callable(obj.__json__):
-            return obj.__json__()
-        elif isinstance(obj, (date, datetime)):
-            return str(obj)
-        elif isinstance(obj, Decimal):
-              # XXX What to do about JSONEncoder crappy handling of Decimals?
-              # SimpleJSON has better Decimal encoding than the std lib
-              # but only in recent versions
-            return float(obj)
-        elif is_saobject(obj):
-            props = {}
-            for key in obj.__dict__:
-                if not key.startswith('_sa_'):
-                    props[key] = getattr(obj, key)
-            return props
-        elif isinstance(obj, ResultProxy):
-            props = dict(rows=list(obj), count=obj.rowcount)
-            if props['count'] < 0:
-                props['count'] = len(props['rows'])
-            return props
-        elif isinstance(obj, RowProxy):
-            return dict(obj)
-        elif isinstance(obj, (MultiDict, UnicodeMultiDict)):
-            return obj.mixed()
-        else:
+        cls = obj.__class__
+        try:
+            encoder = _encoders[cls]
+        except KeyError:
+            encoder = _encoders[cls] = _resolve_encoder(obj)
+        if encoder is None:
             return JSONEncoder.default(self, obj)
+        return encoder(obj)
 
 
 _default = GenericJSON()
@@ -67,12 +108,264 @@ _default = GenericJSON()
 def jsonify(obj):
     return _default.default(obj)
 
+
+# whether any jsonify rule applies to each class; classes without one skip
+# the generic function and go straight to GenericJSON's encoders
+_has_rule = {}
+_object_rule_classes = set()
+
+
+def _find_rule(cls):
+    if cls in _object_rule_classes:
+        return True
+    if not isinstance(cls, type):
+        # old-style classes are dispatched like this by simplegeneric
+        cls = type(cls.__name__, (cls, object), {})
+    for t in cls.__mro__:
+        if t is object:
+            break
+        if jsonify.has_type(t):
+            return True
+    return False
+
+
+def _invalidates_rules(register):
+    def when(*args):
+        decorate = register(*args)
+        def wrapper(f):
+            f = decorate(f)
+            if register is _when_object:
+                _object_rule_classes.update(o.__class__ for o in args)
+            _has_rule.clear()
+            return f
+        return wrapper
+    return when
+
+_when_object = jsonify.when_object
+jsonify.when_type = _invalidates_rules(jsonify.when_type)
+jsonify.when_object = _invalidates_rules(jsonify.when_object)
+
+
+def _encode_default(obj):
+    # called by the JSON backends for anything they can't encode natively
+    cls = obj.__class__
+    try:
+        has_rule = _has_rule[cls]
+    except KeyError:
+        has_rule = _has_rule[cls] = _find_rule(cls)
+    if has_rule:
+        return jsonify(obj)
+    return _default.default(obj)
+
+
 class GenericFunctionJSON(GenericJSON):
     def default(self, obj):
-        return jsonify(obj)
+        return _encode_default(obj)
 
 _instance = GenericFunctionJSON()
     
 
 def encode(obj):
     return _instance.encode(obj)
+
+
+#
+# streaming
+#
+
+_item_separator = _instance.item_separator
+_key_separator = _instance.key_separator
+
+
+def _encode_key(key, encode):
+    if isinstance(key, basestring):
+        return encode(key)
+    # JSON keys are always strings, e.g., 1 -> "1" and None -> "null"
+    key = encode(key)
+    if not key.startswith('"'):
+        key = '"%s"' % key
+    return key
+
+
+def _iterrows(result, fetch_size):
+    fetchmany = getattr(result, 'fetchmany', None)
+    if fetchmany is None:
+        for row in result:
+            yield row
+        return
+    while True:
+        rows = fetchmany(fetch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+
+def _iterencode(obj, encode, depth=0, fetch_size=1000):
+    # result sets and iterators are written out as they are consumed,
+    # rather than being loaded into a list first
+    if isinstance(obj, ResultProxy):
+        try:
+            yield '{%s%s[' % (_encode_key('rows', encode), _key_separator)
+            count = 0
+            for row in _iterrows(obj, fetch_size):
+                if count:
+                    yield _item_separator
+                yield encode(row)
+                count += 1
+            if obj.rowcount >= 0:
+                count = obj.rowcount
+            yield ']%s%s%s%d}' % (
+                _item_separator,
+                _encode_key('count', encode),
+                _key_separator,
+                count
+            )
+        finally:
+            # release the cursor before the request's transaction is torn
+            # down, even if the response is cut short
+            close = getattr(obj, 'close', None)
+            if close is not None:
+                close()
+        return
+    elif _is_iterator(obj):
+        yield '['
+        first = True
+        for value in obj:
+            if first:
+                first = False
+            else:
+                yield _item_separator
+            for fragment in _iterencode(value, encode, depth + 1, fetch_size):
+                yield fragment
+        yield ']'
+        return
+
+    if not isinstance(obj, (basestring, int, long, float, type(None),
+                            list, tuple, dict)):
+        obj = _encode_default(obj)
+
+    # the outermost containers, and any large container, are written out
+    # item by item; everything else is left to the (much faster) encoder
+    if isinstance(obj, dict) and (depth < 2 or len(obj) > 64):
+        yield '{'
+        first = True
+        for key, value in obj.iteritems():
+            if first:
+                first = False
+            else:
+                yield _item_separator
+            yield _encode_key(key, encode)
+            yield _key_separator
+            for fragment in _iterencode(value, encode, depth + 1, fetch_size):
+                yield fragment
+        yield '}'
+    elif isinstance(obj, (list, tuple)) and not hasattr(obj, '_asdict') \
+            and (depth < 2 or len(obj) > 64):
+        yield '['
+        first = True
+        for value in obj:
+            if first:
+                first = False
+            else:
+                yield _item_separator
+            for fragment in _iterencode(value, encode, depth + 1, fetch_size):
+                yield fragment
+        yield ']'
+    else:
+        yield encode(obj)
+
+
+def _chunked(fragments, chunk_size):
+    chunk = []
+    size = 0
+    for fragment in fragments:
+        chunk.append(fragment)
+        size += len(fragment)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iterencode(obj, chunk_size=65536, fetch_size=1000):
+    '''
+    Encodes ``obj`` as JSON incrementally, yielding the output in chunks of
+    roughly ``chunk_size`` bytes rather than building it all in memory.
+    SQLAlchemy ``ResultProxy`` objects are read ``fetch_size`` rows at a
+    time, and other iterators and generators are consumed one item at a
+    time, so neither is ever loaded into memory all at once.
+
+    :param obj: The object to encode.
+    :param chunk_size: The approximate size of each chunk, in bytes.
+    :param fetch_size: The number of rows to fetch from a result set at once.
+    '''
+    return _chunked(_iterencode(obj, encode, 0, fetch_size), chunk_size)
+
+
+#
+# backends
+#
+
+class JSONBackend(object):
+    '''
+    A JSON library used to encode responses and decode request bodies.
+    Anything the library can't encode natively is handed to the usual
+    ``jsonify`` rules and ``__json__`` methods.
+
+    :param dumps: The library's ``dumps`` function, which must accept a ``default`` keyword argument.
+    :param loads: The library's ``loads`` function.
+    '''
+
+    def __init__(self, dumps, loads):
+        self.dumps = dumps
+        self.loads = loads
+
+    def encode(self, obj):
+        return self.dumps(obj, default=_encode_default)
+
+    def iterencode(self, obj, chunk_size=65536, fetch_size=1000):
+        return _chunked(
+            _iterencode(obj, self.encode, 0, fetch_size),
+            chunk_size
+        )
+
+
+_backends = {}
+
+
+def register_backend(name, dumps, loads):
+    '''
+    Makes a JSON library available as a backend, which applications can
+    select with the ``json_backend`` setting.
+
+    :param name: The name of the backend.
+    :param dumps: The library's ``dumps`` function, which must accept a ``default`` keyword argument.
+    :param loads: The library's ``loads`` function.
+    '''
+    _backends[name] = JSONBackend(dumps, loads)
+
+
+def get_backend(name=None):
+    '''
+    Returns the named JSON backend. By default, this is ``simplejson`` if
+    it is installed, or the standard library's ``json`` module otherwise.
+
+    :param name: The name of the backend.
+    '''
+    if name is None:
+        name = default_backend
+    try:
+        return _backends[name]
+    except KeyError:
+        raise ValueError('No JSON backend named %r is available' % name)
+
+
+register_backend('json', json.dumps, json.loads)
+if simplejson is not None:
+    register_backend('simplejson', simplejson.dumps, simplejson.loads)
+    default_backend = 'simplejson'
+else: # pragma: no cover
+    default_backend = 'json'
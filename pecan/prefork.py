@@ -0,0 +1,276 @@
+from BaseHTTPServer import HTTPServer
+from paste.httpserver import WSGIHandler
+
+import errno
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+
+__all__ = ['PreforkServer', 'serve']
+
+
+class _WorkerHandler(WSGIHandler):
+
+    def wsgi_setup(self, environ=None):
+        WSGIHandler.wsgi_setup(self, environ)
+        self.wsgi_environ['wsgi.multithread'] = False
+        self.wsgi_environ['wsgi.multiprocess'] = True
+
+
+class _WorkerServer(HTTPServer):
+    # handles the connections a worker accepts from the master's socket, one
+    # at a time; the worker loop does the accepting
+
+    def __init__(self, app, sock):
+        HTTPServer.__init__(
+            self, sock.getsockname(), _WorkerHandler, bind_and_activate=False
+        )
+        self.socket.close()
+        self.socket = sock
+        self.server_name = socket.getfqdn(self.server_address[0])
+        self.server_port = self.server_address[1]
+        self.wsgi_application = app
+
+
+class PreforkServer(object):
+    '''
+    A WSGI server which forks a number of worker processes to handle
+    requests, so that an application can use more than one CPU.
+
+    The listening socket is bound, and the application loaded, by the
+    master process before any workers are forked, so workers share both
+    (and, until they write to it, the memory the application was loaded
+    into). Each worker handles one request at a time, and is replaced after
+    ``max_requests`` requests.
+
+    The master process handles these signals:
+
+    * ``SIGHUP`` reloads the application (if ``loader`` is given), forks
+      new workers, and asks the old ones to finish their current request
+      and exit.
+    * ``SIGTERM`` and ``SIGINT`` ask the workers to finish their current
+      request and exit, then stop the server.
+
+    :param app: The WSGI application to serve.
+    :param host: The address to listen on.
+    :param port: The port to listen on.
+    :param workers: The number of worker processes.
+    :param max_requests: The number of requests a worker handles before it's replaced, or ``0`` to never replace workers.
+    :param graceful_timeout: The number of seconds workers are given to finish their current request when stopping, after which they are killed.
+    :param loader: A function returning a freshly loaded application, called on ``SIGHUP``.
+    :param backlog: The size of the listening socket's connection queue.
+    '''
+
+    def __init__(self, app, host='0.0.0.0', port=8080, workers=2,
+                 max_requests=0, graceful_timeout=30, loader=None,
+                 backlog=128):
+        self.app = app
+        self.workers = workers
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.loader = loader
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, int(port)))
+        self.socket.listen(backlog)
+        # every worker waits on the socket, and all but one of them lose the
+        # race to accept each connection
+        self.socket.setblocking(0)
+        self.server_address = self.socket.getsockname()
+
+        # the worker processes, mapped to the generation they were forked in
+        self.children = {}
+        self.generation = 0
+        self.master_pid = None
+        self.alive = True
+        self.restarting = False
+
+    def serve_forever(self):
+        '''
+        Forks the workers, and keeps them running until the server is
+        stopped.
+        '''
+
+        self.master_pid = os.getpid()
+        signal.signal(signal.SIGHUP, self.handle_restart)
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        # wakes the master up to replace workers as soon as they exit
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+        try:
+            while self.alive:
+                self.reap()
+                if self.restarting:
+                    self.restart()
+                self.spawn()
+                time.sleep(1)
+        finally:
+            self.stop()
+
+    def handle_restart(self, signum, frame):
+        self.restarting = True
+
+    def handle_stop(self, signum, frame):
+        self.alive = False
+
+    def reap(self):
+        '''
+        Forgets about any workers which have exited.
+        '''
+
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.ECHILD:
+                    raise
+                self.children.clear()
+                break
+            if not pid:
+                break
+            self.children.pop(pid, None)
+
+    def spawn(self):
+        '''
+        Forks workers until there are ``workers`` of the current
+        generation.
+        '''
+
+        current = [
+            pid for pid, generation in self.children.items()
+            if generation == self.generation
+        ]
+        for i in range(self.workers - len(current)):
+            self.spawn_worker()
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = self.generation
+            return pid
+
+        status = 0
+        try:
+            try:
+                self.run_worker()
+            except:
+                traceback.print_exc()
+                status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def restart(self):
+        '''
+        Replaces the workers, reloading the application first if there's a
+        ``loader``. Old workers finish their current request before exiting.
+        '''
+
+        self.restarting = False
+        if self.loader is not None:
+            try:
+                self.app = self.loader()
+            except:
+                # keep serving the application that's already loaded
+                traceback.print_exc()
+                return
+
+        old = self.children.keys()
+        self.generation += 1
+        self.spawn()
+        self.kill(old, signal.SIGTERM)
+
+    def stop(self):
+        '''
+        Asks every worker to exit, waiting up to ``graceful_timeout``
+        seconds before killing those which haven't, and closes the socket.
+        '''
+
+        if os.getpid() != self.master_pid:
+            return
+        self.kill(self.children.keys(), signal.SIGTERM)
+        deadline = time.time() + self.graceful_timeout
+        while self.children and time.time() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.kill(self.children.keys(), signal.SIGKILL)
+        self.reap()
+        self.socket.close()
+
+    def kill(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except OSError, e:
+                if e.errno == errno.ESRCH:
+                    self.children.pop(pid, None)
+                else:
+                    raise
+
+    def run_worker(self):
+        '''
+        Handles requests in a worker process until it's asked to stop, has
+        handled ``max_requests`` requests, or the master process goes away.
+        '''
+
+        alive = [True]
+        def handle_stop(signum, frame):
+            alive[0] = False
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, handle_stop)
+            # let the current request finish uninterrupted
+            signal.siginterrupt(signum, False)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+        server = _WorkerServer(self.app, self.socket)
+        handled = 0
+        while alive[0] and os.getppid() == self.master_pid:
+            if self.max_requests and handled >= self.max_requests:
+                break
+            try:
+                if not select.select([self.socket], [], [], 1.0)[0]:
+                    continue
+                connection, client_address = self.socket.accept()
+            except (select.error, socket.error), e:
+                if e.args[0] in (errno.EINTR, errno.EAGAIN):
+                    continue
+                raise
+
+            connection.setblocking(1)
+            try:
+                server.finish_request(connection, client_address)
+            except:
+                server.handle_error(connection, client_address)
+            server.shutdown_request(connection)
+            handled += 1
+
+
+def serve(app, host='0.0.0.0', port=8080, **kw):
+    '''
+    Serves a WSGI application with a ``PreforkServer`` until it's stopped.
+
+    :param app: The WSGI application to serve.
+    :param host: The address to listen on.
+    :param port: The port to listen on.
+
+    Any other arguments are passed to ``PreforkServer``.
+    '''
+
+    server = PreforkServer(app, host, port, **kw)
+    print 'serving on %s:%s with %d workers (pid %d)' % (
+        server.server_address[0],
+        server.server_address[1],
+        server.workers,
+        os.getpid()
+    )
+    server.serve_forever()
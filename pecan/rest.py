@@ -6,6 +6,87 @@ from routing import lookup_controller
 from util import iscontroller
 
 
+# the methods which may handle each verb, in order of preference
+_verb_handlers = {
+    'get_all'       : ('get_all', 'get'),
+    'get_one'       : ('get_one', 'get'),
+    'new'           : ('new',),
+    'edit'          : ('edit',),
+    'delete'        : ('get_delete',),
+    'post_delete'   : ('post_delete', 'delete'),
+    'post'          : ('post',),
+    'put'           : ('put',)
+}
+
+
+class _DispatchTable(object):
+    '''
+    Everything ``RestController`` routing needs to know about a controller
+    class, worked out once per class rather than on every request.
+    Handlers and custom actions set on an instance aren't known to it, and
+    are looked up on the instance instead.
+    '''
+
+    __slots__ = ('exposed', 'children', 'dynamic', 'routes', 'verbs',
+                 'actions', 'fixed_args', 'var_args')
+
+    def __init__(self, cls):
+        members = {}
+        for name in dir(cls):
+            try:
+                members[name] = getattr(cls, name)
+            except AttributeError:
+                continue
+
+        # exposed methods, and the attributes which may be sub-controllers
+        self.exposed = frozenset(
+            name for name, value in members.iteritems() if iscontroller(value)
+        )
+        self.children = frozenset(
+            name for name, value in members.iteritems()
+            if value and not ismethod(value)
+        )
+        # classes which compute their attributes can't be tabulated
+        self.dynamic = hasattr(cls, '__getattr__')
+
+        # _handle_{method} implementations
+        self.routes = dict(
+            (name[len('_handle_'):], name) for name in members
+            if name.startswith('_handle_')
+        )
+
+        def first(*names):
+            for name in names:
+                if name in self.exposed:
+                    return name
+            return None
+
+        self.verbs = dict(
+            (verb, first(*names)) for verb, names in _verb_handlers.iteritems()
+        )
+
+        # (method, custom action) -> handler
+        self.actions = {}
+        for action, methods in cls._custom_actions.iteritems():
+            for method in methods:
+                self.actions[(method, action)] = first(
+                    '%s_%s' % (method.lower(), action),
+                    action
+                )
+
+        # get_one or get determine how many path segments are arguments
+        self.fixed_args = self.var_args = None
+        for name in ('get_one', 'get'):
+            if name in members:
+                args = getargspec(members[name])
+                self.fixed_args = len(args[0][1:])
+                self.var_args = args[1]
+                break
+
+
+_dispatch_tables = {}
+
+
 class RestController(object):
     '''
     A base class for ``REST`` based controllers. Inherit from this class
@@ -15,6 +96,10 @@ class RestController(object):
     
     _custom_actions = {}
     
+    # the largest form-encoded body (in bytes) which will be parsed just to
+    # look for a ``_method`` override
+    _method_body_limit = 64 * 1024
+    
     @expose()
     def _route(self, args):
         
@@ -27,7 +112,7 @@ class RestController(object):
             #
             method = request.method.lower()
         else:
-            method = request.params.get('_method', request.method).lower()
+            method = self._get_method()
         
         # make sure DELETE/PUT requests don't use GET
         if request.method == 'GET' and method in ('delete', 'put'):
@@ -39,45 +124,106 @@ class RestController(object):
             return result
         
         # handle the request
-        handler = getattr(self, '_handle_%s' % method, self._handle_custom)
+        handler = getattr(
+            self,
+            self._dispatch_table().routes.get(method, '_handle_custom')
+        )
         result = handler(method, args)
         
         # return the result
         return result
     
+    def _get_method(self):
+        '''
+        Returns the request's method, as overridden by a ``_method`` query
+        string parameter, an ``X-HTTP-Method-Override`` header or, for small
+        form-encoded bodies, a ``_method`` form field. Other bodies (such as
+        file uploads) are left unread, for the controller to deal with.
+        '''
+        environ = request.environ
+        method = None
+        if '_method' in environ.get('QUERY_STRING', ''):
+            method = request.GET.get('_method')
+        if method is None:
+            method = environ.get('HTTP_X_HTTP_METHOD_OVERRIDE')
+        if method is None and environ['REQUEST_METHOD'] == 'POST':
+            length = request.content_length
+            if request.content_type == 'application/x-www-form-urlencoded' \
+                    and length is not None \
+                    and length <= self._method_body_limit:
+                method = request.POST.get('_method')
+        return (method or environ['REQUEST_METHOD']).lower()
+    
+    def _dispatch_table(self):
+        cls = self.__class__
+        table = _dispatch_tables.get(cls)
+        if table is None:
+            table = _dispatch_tables[cls] = _DispatchTable(cls)
+        return table
+    
     def _find_controller(self, *args):
+        table = self._dispatch_table()
         for name in args:
-            obj = getattr(self, name, None)
-            if obj and iscontroller(obj):
-                return obj
+            if name in table.exposed or name in self.__dict__ or table.dynamic:
+                obj = getattr(self, name, None)
+                if obj and iscontroller(obj):
+                    return obj
+        return None
+    
+    def _on_instance(self, *names):
+        # whether any of the names may be found on the instance rather than
+        # the class, and so aren't in the dispatch table
+        if self._dispatch_table().dynamic:
+            return True
+        for name in names:
+            if name in self.__dict__:
+                return True
+        return False
+    
+    def _find_verb(self, verb):
+        names = _verb_handlers.get(verb)
+        if names is None or self._on_instance(*names):
+            return self._find_controller(*(names or (verb,)))
+        name = self._dispatch_table().verbs[verb]
+        return name and getattr(self, name)
+    
+    def _find_action(self, method, action):
+        names = ('%s_%s' % (method.lower(), action), action)
+        if self._on_instance('_custom_actions', *names):
+            if method.upper() in self._custom_actions.get(action, []):
+                return self._find_controller(*names)
+            return None
+        name = self._dispatch_table().actions.get((method.upper(), action))
+        return name and getattr(self, name)
+    
+    def _find_child(self, name):
+        table = self._dispatch_table()
+        if name in table.children or name in self.__dict__ or table.dynamic:
+            controller = getattr(self, name, None)
+            if controller and not ismethod(controller):
+                return controller
         return None
     
     def _find_sub_controllers(self, remainder):
         
         # need either a get_one or get to parse args
-        method = None
-        for name in ('get_one', 'get'):
-            if hasattr(self, name):
-                method = name
-                break
-        if not method:
+        table = self._dispatch_table()
+        if table.fixed_args is None:
             return
         
         # get the args to figure out how much to chop off
-        args = getargspec(getattr(self, method))
-        fixed_args = len(args[0][1:]) - len(request.pecan.get('routing_args', []))
-        var_args = args[1]
+        fixed_args = table.fixed_args - len(request.pecan.get('routing_args', []))
         
         # attempt to locate a sub-controller
-        if var_args:
+        if table.var_args:
             for i, item in enumerate(remainder):
-                controller = getattr(self, item, None)
-                if controller and not ismethod(controller):
+                controller = self._find_child(item)
+                if controller:
                     self._set_routing_args(remainder[:i])
                     return lookup_controller(controller, remainder[i + 1:])
-        elif fixed_args < len(remainder) and hasattr(self, remainder[fixed_args]):
-            controller = getattr(self, remainder[fixed_args])
-            if not ismethod(controller):
+        elif fixed_args < len(remainder):
+            controller = self._find_child(remainder[fixed_args])
+            if controller:
                 self._set_routing_args(remainder[:fixed_args])
                 return lookup_controller(controller, remainder[fixed_args + 1:])
     
@@ -93,7 +239,7 @@ class RestController(object):
         if remainder:
             if self._find_controller(remainder[0]):
                 abort(405)
-            sub_controller = getattr(self, remainder[0], None)
+            sub_controller = self._find_child(remainder[0])
             if sub_controller:
                 return lookup_controller(sub_controller, remainder[1:])
         
@@ -103,7 +249,7 @@ class RestController(object):
         
         # route to a get_all or get if no additional parts are available
         if not remainder:
-            controller = self._find_controller('get_all', 'get')
+            controller = self._find_verb('get_all')
             if controller:
                 return controller, []
             abort(404)
@@ -111,23 +257,20 @@ class RestController(object):
         # check for new/edit/delete GET requests
         method_name = remainder[-1]
         if method_name in ('new', 'edit', 'delete'):
-            if method_name == 'delete':
-                method_name = 'get_delete'
-            controller = self._find_controller(method_name)
+            controller = self._find_verb(method_name)
             if controller:
                 return controller, remainder[:-1]
         
         # check for custom GET requests
-        if method.upper() in self._custom_actions.get(method_name, []):
-            controller = self._find_controller('get_%s' % method_name, method_name)
-            if controller:
-                return controller, remainder[:-1]
-        controller = getattr(self, remainder[0], None)
-        if controller and not ismethod(controller):
+        controller = self._find_action(method, method_name)
+        if controller:
+            return controller, remainder[:-1]
+        controller = self._find_child(remainder[0])
+        if controller:
             return lookup_controller(controller, remainder[1:])
         
         # finally, check for the regular get_one/get requests
-        controller = self._find_controller('get_one', 'get')
+        controller = self._find_verb('get_one')
         if controller:
             return controller, remainder
         
@@ -136,7 +279,7 @@ class RestController(object):
     def _handle_delete(self, method, remainder):
         
         # check for post_delete/delete requests first
-        controller = self._find_controller('post_delete', 'delete')
+        controller = self._find_verb('post_delete')
         if controller:
             return controller, remainder
         
@@ -145,7 +288,7 @@ class RestController(object):
         if remainder:
             if self._find_controller(remainder[0]):
                 abort(405)
-            sub_controller = getattr(self, remainder[0], None)
+            sub_controller = self._find_child(remainder[0])
             if sub_controller:
                 return lookup_controller(sub_controller, remainder[1:])
         
@@ -155,17 +298,15 @@ class RestController(object):
 
         # check for custom POST/PUT requests
         if remainder:
-            method_name = remainder[-1]
-            if method.upper() in self._custom_actions.get(method_name, []):
-                controller = self._find_controller('%s_%s' % (method, method_name), method_name)
-                if controller:
-                    return controller, remainder[:-1]
-            controller = getattr(self, remainder[0], None)
-            if controller and not ismethod(controller):
+            controller = self._find_action(method, remainder[-1])
+            if controller:
+                return controller, remainder[:-1]
+            controller = self._find_child(remainder[0])
+            if controller:
                 return lookup_controller(controller, remainder[1:])
         
         # check for regular POST/PUT requests
-        controller = self._find_controller(method)
+        controller = self._find_verb(method)
         if controller:
             return controller, remainder
         
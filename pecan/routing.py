@@ -1,64 +1,238 @@
 from webob import exc
-from inspect import ismethod
+from inspect import ismethod, getmro
+from types import ClassType, FunctionType
 
 from secure import handle_security, cross_boundary
-from util import iscontroller
+from util import iscontroller, LRUCache
 
-__all__ = ['lookup_controller', 'find_object']
+__all__ = ['lookup_controller', 'find_object', 'RouteCache', 'NotFound']
 
 class NonCanonicalPath(Exception):
     def __init__(self, controller, remainder):
         self.controller = controller
         self.remainder = remainder
 
-def lookup_controller(obj, url_path):
+
+class _NotFound(object):
+    '''
+    Returned in place of a controller when routing fails to find one, so
+    that misses don't have to pay for raising and unwinding an exception.
+    '''
+    def __repr__(self):
+        return '<NotFound>'
+    def __nonzero__(self):
+        return False
+
+NotFound = _NotFound()
+
+
+class RouteTrace(object):
+    '''
+    Records what a single traversal depended upon, so that its result can
+    be safely reused for the same path.  Traversals which call into
+    ``_lookup`` or ``_route``, or which resolve a path segment through a
+    property or ``__getattr__``, are dynamic and are never reused, while
+    controller boundaries which carry security are recorded so that their
+    checks can be replayed.
+    '''
+
+    def __init__(self):
+        self.cacheable = True
+        self.boundaries = []
+        self.check_controller = True
+
+    def cross(self, prev_obj, obj):
+        if prev_obj is not None and hasattr(prev_obj, '_pecan'):
+            self.boundaries.append((prev_obj, obj))
+
+
+_missing = object()
+
+
+def _is_plain_attribute(obj, name):
+    '''
+    Returns whether ``getattr(obj, name)`` resolves to a plain attribute of
+    the object or its class, rather than to something computed on each
+    access, such as a property or the result of ``__getattr__``.
+    '''
+
+    if isinstance(obj, (type, ClassType)):
+        cls, instance_dict = type(obj), {}
+        mro = getmro(obj)
+    else:
+        cls = getattr(obj, '__class__', type(obj))
+        instance_dict = getattr(obj, '__dict__', {})
+        mro = getmro(cls)
+        if getattr(cls, '__getattribute__', object.__getattribute__) is not \
+                object.__getattribute__:
+            return False
+
+    value = _missing
+    for klass in mro:
+        if name in vars(klass):
+            value = vars(klass)[name]
+            break
+
+    if value is not _missing:
+        kind = type(value)
+        if hasattr(kind, '__set__') or hasattr(kind, '__delete__'):
+            # data descriptors, e.g., properties, take precedence
+            return False
+        if name in instance_dict:
+            return True
+        return not hasattr(kind, '__get__') or \
+            isinstance(value, (FunctionType, classmethod, staticmethod))
+    if name in instance_dict:
+        return True
+    return not hasattr(cls, '__getattr__')
+
+
+def _getattr(obj, name, trace):
+    if trace is not None and trace.cacheable and \
+            not _is_plain_attribute(obj, name):
+        trace.cacheable = False
+    return getattr(obj, name, None)
+
+
+def _cross_boundary(prev_obj, obj, trace):
+    if trace is not None:
+        trace.cross(prev_obj, obj)
+    cross_boundary(prev_obj, obj)
+
+
+class RouteCache(object):
+    '''
+    A bounded, least-recently-used table of routing results keyed by the
+    split URL path.  Repeat requests for static paths resolve to their
+    ``(controller, remainder)`` without walking the controller tree again;
+    any security checks crossed on the original walk are replayed on every
+    hit, so the outcome always matches ``lookup_controller``.
+
+    Paths which are known not to route anywhere are remembered separately,
+    so that junk traffic can't evict the routes of real pages.
+    '''
+
+    def __init__(self, size=1000, notfound_size=1000):
+        '''
+        :param size: The maximum number of paths to remember. ``0`` disables the cache.
+        :param notfound_size: The maximum number of unroutable paths to remember. ``0`` disables the cache of misses.
+        '''
+
+        self.routes = LRUCache(size)
+        self.misses = LRUCache(notfound_size)
+
+    def lookup(self, root, path):
+        '''
+        Looks up a controller, consulting the cache first.  Returns
+        ``NotFound`` as the controller if the path can't be routed.
+
+        :param root: The node to begin traversal from, such as a root controller.
+        :param path: The URL path, already split into a list of segments.
+        '''
+
+        key = (id(root), tuple(path))
+        entry = self.routes.get(key) or self.misses.get(key)
+        if entry is not None and entry[0] is root:
+            root, controller, remainder, boundaries, check_controller = entry
+            for prev_obj, obj in boundaries:
+                cross_boundary(prev_obj, obj)
+            if check_controller and controller is not NotFound:
+                handle_security(controller)
+            return controller, list(remainder)
+
+        trace = RouteTrace()
+        controller, remainder = resolve_controller(root, path, trace)
+        if trace.cacheable:
+            entry = (
+                root, controller, tuple(remainder), tuple(trace.boundaries),
+                trace.check_controller
+            )
+            if controller is NotFound:
+                self.misses[key] = entry
+            else:
+                self.routes[key] = entry
+        return controller, remainder
+
+    def clear(self):
+        '''
+        Forgets every cached route, e.g., after the controller tree has
+        been modified at runtime.
+        '''
+
+        self.routes.clear()
+        self.misses.clear()
+
+
+def lookup_controller(obj, url_path, trace=None):
+    obj, remainder = resolve_controller(obj, url_path, trace)
+    if obj is NotFound:
+        raise exc.HTTPNotFound
+    return obj, remainder
+
+
+def resolve_controller(obj, url_path, trace=None):
+    '''
+    Works like ``lookup_controller``, but returns ``NotFound`` as the
+    controller rather than raising ``HTTPNotFound`` when the path can't
+    be routed.
+    '''
+
     remainder = url_path
     notfound_handlers = []
 
     while True:
         try:
-            obj, remainder = find_object(obj, remainder, notfound_handlers)
-            handle_security(obj)
-            return obj, remainder
+            obj, remainder = find_object(obj, remainder, notfound_handlers, trace)
+            if obj is not NotFound:
+                handle_security(obj)
+                return obj, remainder
         except exc.HTTPNotFound:
-            while notfound_handlers:
-                name, obj, remainder = notfound_handlers.pop()
-                if name == '_default':
-                    # Notfound handler is, in fact, a controller, so stop
-                    #   traversal
-                    return obj, remainder
-                else:
-                    # Notfound handler is an internal redirect, so continue
-                    #   traversal
-                    try:
-                        result = obj(*remainder)
-                        if result:
-                            prev_obj = obj
-                            obj, remainder = result
-                            # crossing controller boundary
-                            cross_boundary(prev_obj, obj)
-                            break
-                    except TypeError, te:
-                        print 'Got exception calling lookup(): %s (%s)' % (te, te.args)
+            # raised by application code, e.g., from a ``_route`` or a
+            # security check, so the outcome can't be remembered
+            if trace is not None:
+                trace.cacheable = False
+        while notfound_handlers:
+            name, obj, remainder = notfound_handlers.pop()
+            if name == '_default':
+                # Notfound handler is, in fact, a controller, so stop
+                #   traversal
+                if trace is not None:
+                    trace.check_controller = False
+                return obj, remainder
             else:
-                raise exc.HTTPNotFound
+                # Notfound handler is an internal redirect, so continue
+                #   traversal
+                if trace is not None:
+                    trace.cacheable = False
+                try:
+                    result = obj(*remainder)
+                    if result:
+                        prev_obj = obj
+                        obj, remainder = result
+                        # crossing controller boundary
+                        cross_boundary(prev_obj, obj)
+                        break
+                except TypeError, te:
+                    print 'Got exception calling lookup(): %s (%s)' % (te, te.args)
+        else:
+            return NotFound, remainder
 
 
-def find_object(obj, remainder, notfound_handlers):
+def find_object(obj, remainder, notfound_handlers, trace=None):
     prev_obj = None
     while True:
-        if obj is None: raise exc.HTTPNotFound
+        if obj is None: return NotFound, remainder
         if iscontroller(obj): return obj, remainder
 
         # are we traversing to another controller
-        cross_boundary(prev_obj, obj)
+        _cross_boundary(prev_obj, obj, trace)
         
         if remainder and remainder[0] == '':
-            index = getattr(obj, 'index', None)
+            index = _getattr(obj, 'index', trace)
             if iscontroller(index): return index, remainder[1:]
         elif not remainder:
             # the URL has hit an index method without a trailing slash
-            index = getattr(obj, 'index', None)
+            index = _getattr(obj, 'index', trace)
             if iscontroller(index): 
                 raise NonCanonicalPath(index, remainder[1:])
         default = getattr(obj, '_default', None)
@@ -68,14 +242,16 @@ def find_object(obj, remainder, notfound_handlers):
         lookup = getattr(obj, '_lookup', None)
         if iscontroller(lookup):
             notfound_handlers.append(('_lookup', lookup, remainder))
-        
+
         route = getattr(obj, '_route', None)
         if iscontroller(route):
+            if trace is not None:
+                trace.cacheable = False
             next, next_remainder = route(remainder)
             cross_boundary(route, next)
             return next, next_remainder
         
-        if not remainder: raise exc.HTTPNotFound
+        if not remainder: return NotFound, remainder
         next, remainder = remainder[0], remainder[1:]
         prev_obj = obj
-        obj = getattr(obj, next, None)
+        obj = _getattr(obj, next, trace)
@@ -1,10 +1,12 @@
-from inspect import getmembers, ismethod, isfunction
+from inspect import getmembers, ismethod, isfunction, isclass
 from webob import exc
 
+import sys
+
 from decorators import expose
 from util import _cfg, iscontroller
 
-__all__ = ['unlocked', 'secure', 'SecureController']
+__all__ = ['unlocked', 'secure', 'SecureController', 'PermissionCache']
 
 class _SecureState(object):
     def __init__(self, desc, boolean_value):
@@ -41,6 +43,12 @@ class _UnlockedAttribute(object):
     def _lookup(self, *remainder):
         return self.obj, remainder
 
+def _request_pecan():
+    # the current request's ``request.pecan``, or None outside of requests
+    from core import state
+    return getattr(getattr(state, 'request', None), 'pecan', None)
+
+
 class _SecuredAttribute(object):
     def __init__(self, obj, check_permissions):
         self.obj = obj
@@ -49,17 +57,26 @@ class _SecuredAttribute(object):
 
     def _check_permissions(self):
         if isinstance(self.check_permissions, basestring):
-            return getattr(self.parent, self.check_permissions)()
+            return _check(getattr(self.parent, self.check_permissions))
         else:
-            return self.check_permissions()
+            return _check(self.check_permissions)
 
+    # the parent is whatever routing reached this attribute through, which
+    # is specific to each request; wrappers are shared between threads, so
+    # it's kept with the request rather than on the wrapper
     def __get_parent(self):
+        bound = _request_pecan()
+        if bound is not None and id(self) in bound.get('secured_parents', ()):
+            return bound['secured_parents'][id(self)]
         return self._parent
     def __set_parent(self, parent):
         if ismethod(parent):
-            self._parent = parent.im_self
-        else:
+            parent = parent.im_self
+        bound = _request_pecan()
+        if bound is None:
             self._parent = parent
+        else:
+            bound.setdefault('secured_parents', {})[id(self)] = parent
     parent = property(__get_parent, __set_parent)
 
     @_secure_method('_check_permissions')
@@ -116,7 +133,9 @@ class SecureController(object):
     """
     class __metaclass__(type):
         def __init__(cls, name, bases, dict_):
-            cls._pecan = dict(secured=Protected, check_permissions=cls.check_permissions, unlocked=[])
+            # unlocked attributes are kept by identity, so that checking
+            # for them during routing never calls into their __eq__
+            cls._pecan = dict(secured=Protected, check_permissions=cls.check_permissions, unlocked={})
 
             for name, value in getmembers(cls):
                 if ismethod(value):
@@ -127,7 +146,7 @@ class SecureController(object):
                     if name.startswith('__') and name.endswith('__'): continue
                     if isinstance(value, _UnlockedAttribute):
                         # mark it as unlocked and remove wrapper
-                        cls._pecan['unlocked'].append(value.obj)
+                        cls._pecan['unlocked'][id(value.obj)] = value.obj
                         setattr(cls, name, value.obj)
                     elif isinstance(value, _SecuredAttribute):
                         # The user has specified a different check_permissions
@@ -135,12 +154,127 @@ class SecureController(object):
                         # is concerned, this method is unlocked because 
                         # it is using a check_permissions function embedded in
                         # the _SecuredAttribute wrapper
-                        cls._pecan['unlocked'].append(value)
+                        cls._pecan['unlocked'][id(value)] = value
 
     @classmethod
     def check_permissions(cls):
         return False
 
+def _remote_user():
+    from core import request
+    return request.environ.get('REMOTE_USER')
+
+
+def _module_attribute(obj):
+    # only objects which can be found again by their qualified name have a
+    # stable identity to share results under, which rules out lambdas and
+    # functions or classes defined inside other functions or classes
+    module = sys.modules.get(obj.__module__)
+    if getattr(module, obj.__name__, None) is not obj:
+        return None
+    return '%s.%s' % (obj.__module__, obj.__name__)
+
+
+class PermissionCache(object):
+    """
+    Shares the results of permission checks between requests made by the
+    same principal (usually the authenticated user) for ``ttl`` seconds,
+    so that checks which are expensive, e.g., because they go to a session
+    store, aren't repeated on every request.
+
+    Only checks which are module-level functions, or classmethods of
+    module-level classes, are shared, since those are identified by their
+    qualified name. Checks bound to controller instances are specific to
+    the object being accessed, and lambdas and nested functions (such as
+    the checks made by a factory function) can't be told apart by name,
+    so those are only remembered for the rest of the request. Anonymous
+    requests are never shared.
+
+    :param principal: A function returning the principal making the current request, or ``None`` for anonymous requests. Defaults to the ``REMOTE_USER``.
+    :param ttl: The number of seconds to remember results for.
+    :param cache: Where results are stored. Defaults to an in-process ``pecan.cache.MemoryCache``; use a ``pecan.cache.MemcachedCache`` to share them between processes.
+    """
+
+    def __init__(self, principal=_remote_user, ttl=60, cache=None):
+        if cache is None:
+            from cache import MemoryCache
+            cache = MemoryCache(1024 * 1024)
+        self.principal = principal
+        self.ttl = ttl
+        self.cache = cache
+
+    def key(self, check_permissions):
+        if ismethod(check_permissions):
+            owner = check_permissions.im_self
+            if not isclass(owner):
+                return None
+            method = getattr(owner, check_permissions.__name__, None)
+            if getattr(method, 'im_func', None) is not \
+                    check_permissions.im_func:
+                return None
+            name = _module_attribute(owner)
+            if name is None:
+                return None
+            name = '%s.%s' % (name, check_permissions.__name__)
+        elif isfunction(check_permissions):
+            name = _module_attribute(check_permissions)
+            if name is None:
+                return None
+        else:
+            return None
+        principal = self.principal()
+        if principal is None:
+            return None
+        if isinstance(principal, unicode):
+            principal = principal.encode('utf-8')
+        return 'permissions:%s:%s' % (name, principal)
+
+    def get(self, check_permissions):
+        key = self.key(check_permissions)
+        return key and self.cache.get(key)
+
+    def set(self, check_permissions, result):
+        key = self.key(check_permissions)
+        if key:
+            self.cache.set(key, result, self.ttl)
+
+
+def _check(check_permissions):
+    """
+    Calls a permission check, unless it has already been made while
+    handling the current request (or, if the application has a
+    ``PermissionCache``, recently by the same principal).
+    """
+    from core import state
+    memo = _request_pecan()
+    if memo is None:
+        return check_permissions()
+
+    # bound methods are created anew on every attribute access, so they're
+    # remembered by their function and the object they're bound to
+    if ismethod(check_permissions):
+        key = (check_permissions.im_func, id(check_permissions.im_self))
+    else:
+        key = check_permissions
+    memo = memo.setdefault('permissions', {})
+    if key in memo:
+        return memo[key][1]
+
+    shared = getattr(getattr(state, 'app', None), 'permission_cache', None)
+    result = None
+    if shared is not None:
+        result = shared.get(check_permissions)
+    if result is None:
+        result = bool(check_permissions())
+        if shared is not None:
+            shared.set(check_permissions, result)
+
+    # keep the check itself, so that the object it's bound to (and its id)
+    # lives as long as the request does
+    memo[key] = (check_permissions, result)
+    return result
+
+
 # methods to evaluate security during routing
 def handle_security(controller):
     """ Checks the security of a controller.  """
@@ -150,7 +284,7 @@ def handle_security(controller):
         if isinstance(check_permissions, basestring):
             check_permissions = getattr(controller.im_self, check_permissions)
 
-        if not check_permissions():
+        if not _check(check_permissions):
             raise exc.HTTPUnauthorized
 
 def cross_boundary(prev_obj, obj):
@@ -164,5 +298,5 @@ def cross_boundary(prev_obj, obj):
         obj.parent = prev_obj
 
     if hasattr(prev_obj, '_pecan'):
-        if obj not in prev_obj._pecan.get('unlocked', []):
+        if id(obj) not in prev_obj._pecan.get('unlocked', ()):
             handle_security(prev_obj)
@@ -0,0 +1,339 @@
+from email.utils import formatdate, parsedate_tz, mktime_tz
+from hashlib import md5
+from mimetypes import guess_type
+from time import time
+
+import os
+import re
+
+from cache import MemoryCache
+from compression import parse_accept_encoding
+
+__all__ = ['StaticFileMiddleware', 'fingerprint']
+
+
+# fingerprinted file names, e.g., style.0123abcd.css
+_fingerprinted = re.compile(r'^(.+)\.([0-9a-f]{8,32})(\.[^./\\]+)$')
+_byte_range = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# the digests computed by ``fingerprint``, which isn't tied to a middleware;
+# each entry takes about a hundred bytes
+_fingerprints = MemoryCache(1024 * 1024)
+
+
+def _digest(filename, stat, cache):
+    # the MD5 digest of a file's contents, cached by path along with the
+    # modification time and size it was computed for
+    cached = cache.get(filename)
+    if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+        return cached[2]
+    digest = md5()
+    f = open(filename, 'rb')
+    try:
+        for block in iter(lambda: f.read(65536), ''):
+            digest.update(block)
+    finally:
+        f.close()
+    digest = digest.hexdigest()
+    cache.set(filename, (stat.st_mtime, stat.st_size, digest))
+    return digest
+
+
+def fingerprint(path, static_root=None):
+    '''
+    Returns a fingerprinted version of the path to a static file, which
+    includes a hash of its contents, e.g., ``/css/style.css`` becomes
+    ``/css/style.0123abcd.css``. ``StaticFileMiddleware`` serves
+    fingerprinted paths with a far-future expiry time; since the path
+    changes whenever the file does, clients can cache them indefinitely.
+
+    :param path: The path to the file, relative to ``static_root``.
+    :param static_root: The directory static files are served from. Defaults to ``conf.app.static_root``.
+    '''
+    if static_root is None:
+        from configuration import _runtime_conf as conf
+        static_root = conf.app.static_root
+    filename = os.path.join(static_root, path.lstrip('/'))
+    digest = _digest(filename, os.stat(filename), _fingerprints)
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, digest[:8], ext)
+
+
+def _read(f, block_size, length=None):
+    try:
+        while length is None or length > 0:
+            if length is None:
+                block = f.read(block_size)
+            else:
+                block = f.read(min(block_size, length))
+                length -= len(block)
+            if not block:
+                break
+            yield block
+    finally:
+        f.close()
+
+
+class StaticFileMiddleware(object):
+    '''
+    Serves the files in ``static_root``, passing any other request through
+    to the wrapped application.
+
+    Responses carry ``ETag``, ``Last-Modified`` and ``Cache-Control``
+    headers, and conditional and ranged requests are supported. Files are
+    sent with the server's ``wsgi.file_wrapper`` (which usually means
+    ``sendfile``) where available, and small files are kept in memory.
+    Precompressed copies of files (``style.css.gz`` alongside
+    ``style.css``) can be sent to clients which accept ``gzip``.
+
+    :param app: The WSGI application to wrap.
+    :param static_root: The directory static files are served from.
+    :param prefix: The URL path static files are served under, e.g., ``/static``. By default, files are served from ``/``, and only requests which start with the name of a file or directory at the top of ``static_root`` are looked for on disk.
+    :param check_interval: The number of seconds between checks of ``static_root`` for new files and directories at its top, when there's no ``prefix``.
+    :param max_age: The number of seconds clients may cache files for.
+    :param fingerprinted_max_age: The number of seconds clients may cache files requested by a fingerprinted path (see ``fingerprint``) for.
+    :param cache_size: The number of bytes of file contents to keep in memory.
+    :param max_cached_file: The size, in bytes, of the largest file to keep in memory.
+    :param block_size: The number of bytes to read from files at a time.
+    :param precompressed: Whether to send a precompressed ``.gz`` copy of a file, where there is one, to clients which accept ``gzip``.
+    '''
+
+    def __init__(self, app, static_root, prefix=None, max_age=3600,
+                 fingerprinted_max_age=365 * 24 * 3600,
+                 cache_size=16 * 1024 * 1024, max_cached_file=64 * 1024,
+                 block_size=64 * 1024, precompressed=False,
+                 check_interval=1):
+        self.app = app
+        self.static_root = os.path.abspath(static_root)
+        self.prefix = prefix and '/' + prefix.strip('/')
+        self.max_age = max_age
+        self.fingerprinted_max_age = fingerprinted_max_age
+        self.cache = MemoryCache(cache_size)
+        self.digests = MemoryCache(1024 * 1024)
+        self.max_cached_file = max_cached_file
+        self.block_size = block_size
+        self.precompressed = precompressed
+        self.check_interval = check_interval
+        # when static_root was last checked, its modification time then,
+        # and the names at its top
+        self._entries = (0, None, frozenset())
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD') or \
+                not self.matches(path):
+            return self.app(environ, start_response)
+
+        found = self.find(path)
+        if found is None:
+            if self.prefix:
+                start_response('404 Not Found', [
+                    ('Content-Type', 'text/plain'),
+                    ('Content-Length', '9')
+                ])
+                return ['Not Found']
+            return self.app(environ, start_response)
+        return self.serve(environ, start_response, *found)
+
+    def entries(self):
+        '''
+        Returns the names at the top of ``static_root``, which are re-read
+        when the directory has changed, checking at most once every
+        ``check_interval`` seconds. A missing or unreadable ``static_root``
+        has no entries.
+        '''
+        checked, mtime, names = self._entries
+        now = time()
+        if now - checked < self.check_interval:
+            return names
+        try:
+            current = os.stat(self.static_root).st_mtime
+            if current != mtime:
+                names = frozenset(os.listdir(self.static_root))
+        except OSError:
+            current, names = None, frozenset()
+        self._entries = (now, current, names)
+        return names
+
+    def matches(self, path):
+        if self.prefix:
+            return path == self.prefix or path.startswith(self.prefix + '/')
+        name = path.lstrip('/').split('/', 1)[0]
+        if not name:
+            return False
+        entries = self.entries()
+        if name in entries:
+            return True
+        fingerprinted = _fingerprinted.match(name)
+        return fingerprinted is not None and \
+            fingerprinted.group(1) + fingerprinted.group(3) in entries
+
+    def find(self, path):
+        '''
+        Returns the file a path refers to, its ``os.stat`` result and
+        whether the path was fingerprinted, or ``None`` if there's no such
+        file.
+        '''
+        if self.prefix:
+            path = path[len(self.prefix):]
+        filename = os.path.abspath(
+            os.path.join(self.static_root, path.lstrip('/'))
+        )
+        if not filename.startswith(self.static_root + os.sep):
+            return None
+        if path.endswith('/'):
+            filename = os.path.join(filename, 'index.html')
+        if os.path.isfile(filename):
+            return filename, os.stat(filename), False
+
+        fingerprinted = _fingerprinted.match(filename)
+        if fingerprinted is not None:
+            filename = fingerprinted.group(1) + fingerprinted.group(3)
+            if os.path.isfile(filename):
+                stat = os.stat(filename)
+                digest = _digest(filename, stat, self.digests)
+                if digest.startswith(fingerprinted.group(2)):
+                    return filename, stat, True
+        return None
+
+    def serve(self, environ, start_response, filename, stat, fingerprinted):
+        content_type = guess_type(filename)[0] or 'application/octet-stream'
+        headers = []
+        coding = None
+        if self.precompressed and os.path.isfile(filename + '.gz'):
+            headers.append(('Vary', 'Accept-Encoding'))
+            if self.accepts_gzip(environ):
+                filename += '.gz'
+                stat = os.stat(filename)
+                coding = 'gzip'
+
+        mtime = int(stat.st_mtime)
+        size = stat.st_size
+        max_age = fingerprinted and self.fingerprinted_max_age or self.max_age
+        if coding is None:
+            etag = '"%x-%x"' % (mtime, size)
+        else:
+            # the compressed copy is a different representation, with a tag
+            # of its own, and ranges of it aren't offered
+            etag = '"%x-%x-%s"' % (mtime, size, coding)
+        headers.extend([
+            ('ETag', etag),
+            ('Last-Modified', formatdate(mtime, usegmt=True)),
+            ('Cache-Control', 'public, max-age=%d' % max_age)
+        ])
+        if coding is None:
+            headers.append(('Accept-Ranges', 'bytes'))
+
+        if self.not_modified(environ, etag, mtime):
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers.append(('Content-Type', content_type))
+        if coding is not None:
+            headers.append(('Content-Encoding', coding))
+
+        start, end = 0, size - 1
+        status = '200 OK'
+        byte_range = None
+        if coding is None:
+            byte_range = self.byte_range(environ, etag, size)
+        if byte_range == 'unsatisfiable':
+            start_response('416 Requested Range Not Satisfiable', [
+                ('Content-Range', 'bytes */%d' % size),
+                ('Content-Length', '0')
+            ])
+            return []
+        elif byte_range is not None:
+            start, end = byte_range
+            status = '206 Partial Content'
+            headers.append(
+                ('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+            )
+        headers.append(('Content-Length', str(end - start + 1)))
+        start_response(status, headers)
+
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+
+        data = self.cached(filename, stat)
+        if data is not None:
+            return [data[start:end + 1]]
+
+        f = open(filename, 'rb')
+        if byte_range is None:
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                return file_wrapper(f, self.block_size)
+            return _read(f, self.block_size)
+        f.seek(start)
+        return _read(f, self.block_size, end - start + 1)
+
+    def accepts_gzip(self, environ):
+        accepted = parse_accept_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        return accepted.get('gzip', accepted.get('*', 0)) > 0
+
+    def cached(self, filename, stat):
+        '''
+        Returns the contents of a small file from memory, reading it in the
+        first time, or ``None`` for files too large to keep in memory.
+        '''
+        if stat.st_size > self.max_cached_file:
+            return None
+        entry = self.cache.get(filename)
+        if entry is not None and entry[:2] == (stat.st_mtime, stat.st_size):
+            return entry[2]
+        f = open(filename, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        self.cache.set(filename, (stat.st_mtime, stat.st_size, data))
+        return data
+
+    def not_modified(self, environ, etag, mtime):
+        # If-None-Match takes precedence over If-Modified-Since
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return etag in tags or '*' in tags
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since is not None:
+            parsed = parsedate_tz(if_modified_since.split(';')[0])
+            return parsed is not None and mtime <= mktime_tz(parsed)
+        return False
+
+    def byte_range(self, environ, etag, size):
+        '''
+        Returns the first and last byte of the single range requested by a
+        ``Range`` header, ``None`` if the whole file should be sent, or
+        ``'unsatisfiable'``.
+        '''
+        header = environ.get('HTTP_RANGE')
+        if header is None:
+            return None
+        if_range = environ.get('HTTP_IF_RANGE')
+        if if_range is not None and if_range.strip() != etag:
+            return None
+        match = _byte_range.match(header.strip())
+        if match is None:
+            # multiple or malformed ranges; just send the whole file
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            # the last N bytes
+            length = int(last)
+            if length == 0:
+                return 'unsatisfiable'
+            return max(size - length, 0), size - 1
+        first = int(first)
+        if first >= size:
+            return 'unsatisfiable'
+        if last:
+            last = min(int(last), size - 1)
+        else:
+            last = size - 1
+        if last < first:
+            return None
+        return first, last
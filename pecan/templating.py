@@ -1,21 +1,51 @@
 import cgi
+import os
+import pkgutil
+import sys
+from UserDict import DictMixin
 
 __all__ = ['RendererFactory']
 
 _builtin_renderers = {}
 error_formatters = []
 
+
+def _register(name, renderer, engine):
+    '''
+    Registers a builtin renderer if its template engine is installed. The
+    engine is located without being imported; renderers only import their
+    engine when they are first created by ``RendererFactory.get``.
+    '''
+    # find_loader honours PEP 302 import hooks, so engines installed as
+    # zipped eggs are found too
+    try:
+        if pkgutil.find_loader(engine) is None:     # pragma no cover
+            return
+    except ImportError:                             # pragma no cover
+        return
+    _builtin_renderers[name] = renderer
+
 #
 # JSON rendering engine
 #
 
 class JsonRenderer(object):
-    def __init__(self, path, extra_vars):
-        pass
+    def __init__(self, path, extra_vars, reload=True, stream=False,
+                 chunk_size=65536, fetch_size=1000, backend=None):
+        from jsonify import get_backend
+        self.backend = get_backend(backend)
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.fetch_size = fetch_size
     
     def render(self, template_path, namespace):
-        from jsonify import encode
-        return encode(namespace)
+        if self.stream:
+            return self.backend.iterencode(
+                namespace,
+                self.chunk_size,
+                self.fetch_size
+            )
+        return self.backend.encode(namespace)
 
 _builtin_renderers['json'] = JsonRenderer
 
@@ -24,107 +54,175 @@ _builtin_renderers['json'] = JsonRenderer
 # Genshi rendering engine
 # 
 
-try:
-    from genshi.template import (TemplateLoader,
-                                TemplateError as gTemplateError)
+class GenshiRenderer(object):
+    # Genshi looks names up through a stack of frames, so it's given the
+    # namespaces as layers rather than merged into a new dictionary
+    layered = True
 
-    class GenshiRenderer(object):
-        def __init__(self, path, extra_vars):
-            self.loader = TemplateLoader([path], auto_reload=True)
-            self.extra_vars = extra_vars
-    
-        def render(self, template_path, namespace):
-            tmpl = self.loader.load(template_path)
-            stream = tmpl.generate(**self.extra_vars.make_ns(namespace))
-            return stream.render('html')
+    def __init__(self, path, extra_vars, reload=True):
+        from genshi.template import TemplateLoader
+        self.loader = TemplateLoader([path], auto_reload=reload)
+        self.extra_vars = extra_vars
+
+    def render(self, template_path, namespace):
+        tmpl = self.loader.load(template_path)
+        ns = self.extra_vars.make_layers(namespace)
+        if isinstance(ns, LayeredNamespace):
+            from genshi.template import Context
+            ctxt = Context()
+            for layer in reversed(ns.maps):
+                ctxt.push(layer)
+            stream = tmpl.generate(ctxt)
+        else:
+            stream = tmpl.generate(**ns)
+        return stream.render('html')
 
-    _builtin_renderers['genshi'] = GenshiRenderer
- 
-    def format_genshi_error(exc_value):
-        if isinstance(exc_value, (gTemplateError)):
-            retval = '<h4>Genshi error %s</h4>' % cgi.escape(exc_value.message)
-            retval += format_line_context(exc_value.filename, exc_value.lineno)
-            return retval
-    error_formatters.append(format_genshi_error)
-except ImportError:                                 #pragma no cover
-    pass
+_register('genshi', GenshiRenderer, 'genshi')
+
+def format_genshi_error(exc_value):
+    if 'genshi.template' not in sys.modules:
+        return
+    from genshi.template import TemplateError as gTemplateError
+    if isinstance(exc_value, (gTemplateError)):
+        retval = '<h4>Genshi error %s</h4>' % cgi.escape(exc_value.message)
+        retval += format_line_context(exc_value.filename, exc_value.lineno)
+        return retval
+error_formatters.append(format_genshi_error)
 
 
 #
 # Mako rendering engine
 #
 
-try:
-    from mako.lookup import TemplateLookup
-    from mako.exceptions import CompileException, SyntaxException, \
-            html_error_template
-
-    class MakoRenderer(object):
-        def __init__(self, path, extra_vars):
-            self.loader = TemplateLookup(directories=[path], output_encoding='utf-8')
-            self.extra_vars = extra_vars
-    
-        def render(self, template_path, namespace):
-            tmpl = self.loader.get_template(template_path)
-            return tmpl.render(**self.extra_vars.make_ns(namespace))
+class MakoRenderer(object):
+    def __init__(self, path, extra_vars, reload=True, module_directory=None,
+                 filesystem_checks=None, precompile=False):
+        from mako.lookup import TemplateLookup
+        if filesystem_checks is None:
+            filesystem_checks = reload
+        self.loader = TemplateLookup(
+            directories=[path],
+            output_encoding='utf-8',
+            module_directory=module_directory,
+            filesystem_checks=filesystem_checks
+        )
+        self.path = path
+        self.extra_vars = extra_vars
+        if precompile:
+            self.precompile(precompile)
+
+    def precompile(self, extensions=True):
+        from mako.exceptions import CompileException, SyntaxException
+        for uri in find_templates(self.path, extensions):
+            try:
+                self.loader.get_template(uri)
+            except (CompileException, SyntaxException):
+                # leave the error to be reported when it is rendered
+                continue
 
-    _builtin_renderers['mako'] = MakoRenderer
+    def render(self, template_path, namespace):
+        tmpl = self.loader.get_template(template_path)
+        return tmpl.render(**self.extra_vars.make_ns(namespace))
 
-    def format_mako_error(exc_value):
-        if isinstance(exc_value, (CompileException, SyntaxException)):
-            return html_error_template().render(full=False, css=False)
+_register('mako', MakoRenderer, 'mako')
 
-    error_formatters.append(format_mako_error)
-except ImportError:                                 # pragma no cover
-    pass
+def format_mako_error(exc_value):
+    if 'mako.exceptions' not in sys.modules:
+        return
+    from mako.exceptions import CompileException, SyntaxException, \
+            html_error_template
+    if isinstance(exc_value, (CompileException, SyntaxException)):
+        return html_error_template().render(full=False, css=False)
+error_formatters.append(format_mako_error)
 
 
 #
 # Kajiki rendering engine
 #
 
-try:
-    from kajiki.loader import FileLoader
+class KajikiRenderer(object):
+    def __init__(self, path, extra_vars, reload=True):
+        from kajiki.loader import FileLoader
+        self.loader = FileLoader(path, reload=reload)
+        self.extra_vars = extra_vars
+
+    def render(self, template_path, namespace):
+        Template = self.loader.import_(template_path)
+        stream = Template(self.extra_vars.make_ns(namespace))
+        return stream.render()
 
-    class KajikiRenderer(object):
-        def __init__(self, path, extra_vars):
-            self.loader = FileLoader(path, reload=True)
-            self.extra_vars = extra_vars
+_register('kajiki', KajikiRenderer, 'kajiki')
+# TODO: add error formatter for kajiki
 
-        def render(self, template_path, namespace):
-            Template = self.loader.import_(template_path)
-            stream = Template(self.extra_vars.make_ns(namespace))
-            return stream.render()
-    _builtin_renderers['kajiki'] = KajikiRenderer
-    # TODO: add error formatter for kajiki
-except ImportError:                                 # pragma no cover
-    pass
 
 #
 # Jinja2 rendering engine
 #
-try:
-    from jinja2 import Environment, FileSystemLoader
-    from jinja2.exceptions import TemplateSyntaxError as jTemplateSyntaxError
 
-    class JinjaRenderer(object):
-        def __init__(self, path, extra_vars):
-            self.env = Environment(loader=FileSystemLoader(path))
-            self.extra_vars = extra_vars
+class JinjaRenderer(object):
+    def __init__(self, path, extra_vars, reload=True, bytecode_cache=None,
+                 cache_size=400, precompile=False):
+        from jinja2 import Environment, FileSystemLoader, \
+                FileSystemBytecodeCache
+        if isinstance(bytecode_cache, basestring):
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache)
+        self.env = Environment(
+            loader=FileSystemLoader(path),
+            auto_reload=reload,
+            bytecode_cache=bytecode_cache,
+            cache_size=cache_size
+        )
+        self.path = path
+        self.extra_vars = extra_vars
+        if precompile:
+            self.precompile(precompile)
+
+    def precompile(self, extensions=True):
+        from jinja2.exceptions import TemplateSyntaxError
+        for uri in find_templates(self.path, extensions):
+            try:
+                self.env.get_template(uri.lstrip('/'))
+            except TemplateSyntaxError:
+                # leave the error to be reported when it is rendered
+                continue
 
-        def render(self, template_path, namespace):
-            template = self.env.get_template(template_path)
-            return template.render(self.extra_vars.make_ns(namespace))
-    _builtin_renderers['jinja'] = JinjaRenderer
+    def render(self, template_path, namespace):
+        template = self.env.get_template(template_path)
+        return template.render(self.extra_vars.make_ns(namespace))
 
-    def format_jinja_error(exc_value):
-        if isinstance(exc_value, (jTemplateSyntaxError)):
-            retval = '<h4>Jinja2 template syntax error in \'%s\' on line %d</h4><div>%s</div>' % (exc_value.name, exc_value.lineno, exc_value.message)
-            retval += format_line_context(exc_value.filename, exc_value.lineno)
-            return retval
-    error_formatters.append(format_jinja_error)
-except ImportError:                                 # pragma no cover
-    pass
+_register('jinja', JinjaRenderer, 'jinja2')
+
+def format_jinja_error(exc_value):
+    if 'jinja2.exceptions' not in sys.modules:
+        return
+    from jinja2.exceptions import TemplateSyntaxError as jTemplateSyntaxError
+    if isinstance(exc_value, (jTemplateSyntaxError)):
+        retval = '<h4>Jinja2 template syntax error in \'%s\' on line %d</h4><div>%s</div>' % (exc_value.name, exc_value.lineno, exc_value.message)
+        retval += format_line_context(exc_value.filename, exc_value.lineno)
+        return retval
+error_formatters.append(format_jinja_error)
+
+#
+# template discovery helper function
+#
+def find_templates(path, extensions=True):
+    '''
+    Yields the URI of every template under ``path``, for renderers which
+    support compiling their templates ahead of time.
+
+    :param path: The template directory to search.
+    :param extensions: A list of file extensions to include, or ``True`` for every file.
+    '''
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            if filename.startswith('.') or filename.endswith(('.pyc', '.pyo', '.py')):
+                continue
+            if extensions is not True and \
+                os.path.splitext(filename)[1] not in extensions:
+                continue
+            relative = os.path.relpath(os.path.join(dirpath, filename), path)
+            yield '/' + relative.replace(os.sep, '/')
 
 #
 # format helper function
@@ -149,6 +247,70 @@ def format_line_context(filename, lineno, context=10):
 #
 # Extra Vars Rendering 
 #
+class LayeredNamespace(DictMixin):
+    '''
+    A read-through view over several namespaces, searched in order, for
+    renderers whose engine can look names up through layers (those with a
+    true ``layered`` attribute, such as Genshi's), so that the controller's
+    namespace, Pecan's helpers and any extra template variables needn't be
+    merged into a new dictionary for them. Writes go to a private top layer,
+    leaving the underlying namespaces untouched.
+    '''
+
+    def __init__(self, *maps):
+        self.maps = [{}]
+        for ns in maps:
+            if isinstance(ns, LayeredNamespace):
+                self.maps.extend(ns.maps)
+            else:
+                self.maps.append(ns)
+
+    def __getitem__(self, key):
+        for ns in self.maps:
+            if key in ns:
+                return ns[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        for ns in self.maps:
+            if key in ns:
+                return True
+        return False
+
+    has_key = __contains__
+
+    def __setitem__(self, key, value):
+        self.maps[0][key] = value
+
+    def __delitem__(self, key):
+        del self.maps[0][key]
+
+    def keys(self):
+        return self.copy().keys()
+
+    def iteritems(self):
+        return self.copy().iteritems()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.copy())
+
+    def copy(self):
+        '''
+        Returns the merged namespace as a plain dictionary, built with one
+        ``update`` per layer.
+        '''
+        merged = {}
+        for ns in reversed(self.maps):
+            merged.update(ns)
+        return merged
+
+    def __repr__(self):
+        return 'LayeredNamespace(%r)' % (self.maps[1:],)
+
+
 class ExtraNamespace(object):
     def __init__(self, extras={}):
         self.namespace = dict(extras)
@@ -165,15 +327,29 @@ class ExtraNamespace(object):
         else:
             return ns
 
+    def make_layers(self, ns):
+        '''
+        Like ``make_ns``, but returns a ``LayeredNamespace`` over the
+        namespace and the extra variables rather than merging them, for
+        renderers which can search layers.
+        '''
+        if self.namespace:
+            return LayeredNamespace(ns, self.namespace)
+        else:
+            return ns
+
 #
 # Rendering Factory
 #
 class RendererFactory(object):
-    def __init__(self, custom_renderers={}, extra_vars={}):
+    def __init__(self, custom_renderers={}, extra_vars={}, options={},
+                 reload=True):
         self._renderers = {}
         self._renderer_classes = dict(_builtin_renderers)
         self.add_renderers(custom_renderers)
         self.extra_vars = ExtraNamespace(extra_vars)
+        self.options = dict(options)
+        self.reload = reload
 
     def add_renderers(self, custom_dict):
         self._renderer_classes.update(custom_dict)
@@ -187,5 +363,14 @@ class RendererFactory(object):
             if cls is None:
                 return None
             else:
-                self._renderers[name] = cls(template_path, self.extra_vars)
+                options = {}
+                if cls is _builtin_renderers.get(name):
+                    # custom renderers may not know about reloading
+                    options['reload'] = self.reload
+                options.update(self.options.get(name, {}))
+                self._renderers[name] = cls(
+                    template_path,
+                    self.extra_vars,
+                    **options
+                )
         return self._renderers[name]
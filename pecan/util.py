@@ -1,5 +1,6 @@
 import sys
 import os
+from threading import Lock
 
 def iscontroller(obj):
     return getattr(obj, 'exposed', False)
@@ -8,6 +9,26 @@ def _cfg(f):
     if not hasattr(f, '_pecan'): f._pecan = {}
     return f._pecan
 
+class ArgumentPlan(object):
+    '''
+    A precompiled form of a controller's argument specification, built once
+    by ``expose`` so that binding arguments on each request doesn't need to
+    re-interpret the ``argspec``.
+    '''
+
+    __slots__ = ('names', 'positional', 'defaults', 'varargs', 'varkw')
+
+    def __init__(self, argspec):
+        args, varargs, varkw, defaults = argspec
+        self.names      = frozenset(args)
+        self.positional = tuple(args[1:])
+        if defaults:
+            self.defaults = dict(zip(args[-len(defaults):], defaults))
+        else:
+            self.defaults = {}
+        self.varargs    = bool(varargs)
+        self.varkw      = bool(varkw)
+
 def compat_splitext(path):
     """
     This method emulates the behavior os.path.splitext introduced in python 2.6
@@ -29,3 +50,137 @@ else:                             #pragma no cover
     splitext = compat_splitext
 
 
+
+
+class LRUCache(object):
+    '''
+    A small, thread-safe, bounded mapping which discards the least recently
+    used entry once ``maxsize`` entries are stored. A ``maxsize`` of ``0``
+    disables storage entirely.
+    '''
+
+    # indexes into a link: [prev, next, key, value]
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._links = {}
+        self._lock = Lock()
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                return default
+            self._unlink(link)
+            self._append(link)
+            return link[self.VALUE]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[self.VALUE] = value
+            else:
+                if len(self._links) >= self.maxsize:
+                    oldest = self._root[self.NEXT]
+                    self._unlink(oldest)
+                    del self._links[oldest[self.KEY]]
+                link = [None, None, key, value]
+                self._links[key] = link
+            self._append(link)
+        finally:
+            self._lock.release()
+
+    __setitem__ = set
+
+    def pop(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._links.pop(key, None)
+            if link is None:
+                return default
+            self._unlink(link)
+            return link[self.VALUE]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._links.clear()
+            root = self._root
+            root[:] = [root, root, None, None]
+        finally:
+            self._lock.release()
+
+    def _unlink(self, link):
+        prev, next = link[self.PREV], link[self.NEXT]
+        prev[self.NEXT] = next
+        next[self.PREV] = prev
+
+    def _append(self, link):
+        root = self._root
+        last = root[self.PREV]
+        link[self.PREV], link[self.NEXT] = last, root
+        last[self.NEXT] = root[self.PREV] = link
+
+
+class ContextLocal(object):
+    '''
+    Works like ``threading.local``, but keeps separate attributes for each
+    context identified by ``ident``, e.g., ``greenlet.getcurrent`` to give
+    every greenlet its own, or a function returning the current
+    ``asyncio`` task.
+
+    :param ident: A function returning a hashable identifier for the current context.
+    '''
+
+    __slots__ = ('_ident', '_contexts')
+
+    def __init__(self, ident):
+        object.__setattr__(self, '_ident', ident)
+        object.__setattr__(self, '_contexts', {})
+
+    @property
+    def __dict__(self):
+        return self._contexts.setdefault(self._ident(), {})
+
+    def __getattr__(self, name):
+        try:
+            return self._contexts[self._ident()][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        ident = self._ident()
+        try:
+            self._contexts[ident][name] = value
+        except KeyError:
+            self._contexts[ident] = {name: value}
+
+    def __delattr__(self, name):
+        ident = self._ident()
+        try:
+            attributes = self._contexts[ident]
+            del attributes[name]
+        except KeyError:
+            raise AttributeError(name)
+        # forget contexts once they're empty, as they may never be seen again
+        if not attributes:
+            del self._contexts[ident]
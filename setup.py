@@ -60,6 +60,10 @@ setup(
     zip_safe             = False,
     cmdclass             = {'test': PyTest},
     install_requires     = requirements,
+    extras_require       = {
+        # pecan.asynchronous.AsyncPecan
+        'async' : ['trollius >= 2.0', 'futures >= 2.1']
+    },
     entry_points         = """
     [paste.paster_command]
     pecan-serve = pecan.commands:ServeCommand
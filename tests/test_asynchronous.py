@@ -0,0 +1,216 @@
+from unittest import TestCase, SkipTest
+from pecan import expose, request, response, core
+from pecan.hooks import PecanHook
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+except ImportError:
+    asyncio = None
+
+
+class TestAsyncPecan(TestCase):
+
+    def setUp(self):
+        if asyncio is None:
+            raise SkipTest('trollius is not installed')
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def make_app(self, root, **kw):
+        from pecan.asynchronous import AsyncPecan
+        return AsyncPecan(root, loop=self.loop, **kw)
+
+    def get(self, app, path, method='GET', body=''):
+        scope = dict(type='http', method=method, path=path, headers=[])
+        messages = [dict(body=body)]
+        sent = []
+
+        @asyncio.coroutine
+        def receive():
+            raise Return(messages.pop(0))
+
+        @asyncio.coroutine
+        def send(message):
+            sent.append(message)
+
+        self.loop.run_until_complete(app.asgi(scope, receive, send))
+        return sent[0]['status'], ''.join(m['body'] for m in sent[1:])
+
+    def test_sync_controller(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                return 'Hello, %s!' % request.path
+
+        status, body = self.get(self.make_app(RootController()), '/')
+        assert status == 200
+        assert body == 'Hello, /!'
+
+    def test_coroutine_controller(self):
+        loop = self.loop
+
+        class RootController(object):
+            @expose()
+            @asyncio.coroutine
+            def index(self):
+                yield From(asyncio.sleep(0, loop=loop))
+                response.status = 201
+                raise Return('Hello, %s!' % request.path)
+
+        status, body = self.get(self.make_app(RootController()), '/')
+        assert status == 201
+        assert body == 'Hello, /!'
+
+    def test_not_found(self):
+        class RootController(object):
+            pass
+
+        status, body = self.get(self.make_app(RootController()), '/missing')
+        assert status == 404
+
+    def test_concurrent_requests_keep_their_state(self):
+        loop = self.loop
+        paths = []
+
+        class RootController(object):
+            @expose()
+            @asyncio.coroutine
+            def _default(self, *remainder):
+                path = request.path
+                yield From(asyncio.sleep(0.01, loop=loop))
+                paths.append((path, request.path))
+                raise Return(request.path)
+
+        app = self.make_app(RootController())
+        results = loop.run_until_complete(asyncio.gather(
+            *[app.dispatch(self.environ('/%d' % i)) for i in range(5)],
+            loop=loop
+        ))
+        assert len(results) == 5
+        assert all(before == after for before, after in paths)
+
+    def test_coroutine_hooks(self):
+        loop = self.loop
+        run = []
+
+        class AsyncHook(PecanHook):
+            @asyncio.coroutine
+            def before(self, state):
+                yield From(asyncio.sleep(0, loop=loop))
+                run.append('before')
+
+            def after(self, state):
+                run.append('after')
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                run.append('index')
+                return 'Hello!'
+
+        app = self.make_app(RootController(), hooks=[AsyncHook()])
+        status, body = self.get(app, '/')
+        assert status == 200
+        assert run == ['before', 'index', 'after']
+
+    def test_streamed_body_runs_after_hooks_once_sent(self):
+        run = []
+
+        class RecordingHook(PecanHook):
+            def after(self, state):
+                run.append(('after', state.request.path))
+
+        def items():
+            for i in range(3):
+                run.append(i)
+                yield i
+
+        class RootController(object):
+            @expose('json')
+            def index(self):
+                return dict(items=items())
+
+        app = self.make_app(
+            RootController(),
+            hooks=[RecordingHook()],
+            template_options={'json': {'stream': True}}
+        )
+        status, body = self.get(app, '/')
+        assert status == 200
+        assert body == '{"items": [0, 1, 2]}'
+        assert run == [0, 1, 2, ('after', '/')]
+
+    def test_default_event_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            from pecan.asynchronous import AsyncPecan
+
+            class RootController(object):
+                @expose()
+                def index(self):
+                    return 'Hello, %s!' % request.path
+
+            status, body = self.get(AsyncPecan(RootController()), '/')
+            assert status == 200
+            assert body == 'Hello, /!'
+        finally:
+            asyncio.set_event_loop(None)
+
+    def test_nested_coroutines_see_the_request(self):
+        loop = self.loop
+
+        @asyncio.coroutine
+        def describe():
+            yield From(asyncio.sleep(0.01, loop=loop))
+            raise Return('%s %s' % (request.method, request.path))
+
+        class RootController(object):
+            @expose()
+            @asyncio.coroutine
+            def _default(self, *remainder):
+                first = yield From(describe())
+                second = yield From(describe())
+                raise Return('%s, %s' % (first, second))
+
+        app = self.make_app(RootController())
+        responses = loop.run_until_complete(asyncio.gather(
+            *[app.dispatch(self.environ('/%d' % i)) for i in range(5)],
+            loop=loop
+        ))
+        bodies = [r.body for r in responses]
+        assert bodies == [
+            'GET /%d, GET /%d' % (i, i) for i in range(5)
+        ]
+
+    def test_concurrent_sync_controllers(self):
+        import time
+
+        class RootController(object):
+            @expose()
+            def _default(self, *remainder):
+                path = request.path
+                time.sleep(0.01)
+                response.status = 201
+                return '%s %s' % (path, request.path)
+
+        app = self.make_app(RootController(), max_threads=5)
+        responses = self.loop.run_until_complete(asyncio.gather(
+            *[app.dispatch(self.environ('/%d' % i)) for i in range(5)],
+            loop=self.loop
+        ))
+        assert [r.status_int for r in responses] == [201] * 5
+        assert [r.body for r in responses] == [
+            '/%d /%d' % (i, i) for i in range(5)
+        ]
+
+    def test_thread_state_is_left_alone(self):
+        state = core.state
+        self.make_app(object())
+        assert core.state is state
+
+    def environ(self, path):
+        from webob import Request
+        return Request.blank(path).environ
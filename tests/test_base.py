@@ -2,11 +2,14 @@ from formencode import Schema, validators
 from paste.recursive import ForwardRequestException
 from paste.translogger import TransLogger
 from unittest import TestCase
+from webob import Request
+from webob.exc import HTTPNotFound
 from webtest import TestApp
 
-from pecan import Pecan, expose, request, response, redirect, abort, make_app, override_template, render
+from pecan import Pecan, expose, request, response, redirect, abort, make_app, override_template, render, conditional
 from pecan.templating import _builtin_renderers as builtin_renderers, error_formatters
-from pecan.decorators import accept_noncanonical
+from pecan.decorators import accept_noncanonical, etag
+from pecan.hooks import PecanHook
 
 import os
 
@@ -615,6 +618,38 @@ class TestBase(TestCase):
         
         assert state.__dict__.keys() == ['app']
 
+    def test_request_state_per_context(self):
+        """
+        With set_context_ident, request state belongs to a context such as
+        a greenlet rather than to a thread
+        """
+        from pecan import core, request
+        from pecan.util import ContextLocal
+        
+        current = ['first']
+        
+        class RootController(object):
+            @expose()
+            def index(self):
+                # another context on the same thread sees none of this request
+                current[0] = 'second'
+                assert not hasattr(core.state, 'request')
+                current[0] = 'first'
+                return request.path
+        
+        core.set_context_ident(lambda: current[0])
+        try:
+            assert isinstance(core.state, ContextLocal)
+            app = TestApp(Pecan(RootController()))
+            r = app.get('/')
+            assert r.status_int == 200
+            assert r.body == '/'
+            
+            # nothing is kept once the request is over
+            assert core.state._contexts == {}
+        finally:
+            core.set_context_ident()
+
     def test_extension(self):
         """
         Test extension splits
@@ -1007,6 +1042,66 @@ class TestEngines(object):
                     break
         assert error_msg is not None
     
+    def test_mako_compiled_module_cache(self):
+        if 'mako' not in builtin_renderers:
+            return
+        
+        import shutil, tempfile
+        class RootController(object):
+            @expose('mako:mako.html')
+            def index(self, name='Jonathan'):
+                return dict(name=name)
+        
+        module_directory = tempfile.mkdtemp()
+        try:
+            app = Pecan(RootController(), template_path=self.template_path,
+                        template_options={'mako': dict(
+                            module_directory=module_directory,
+                            filesystem_checks=False,
+                            precompile=['.html']
+                        )})
+            
+            # every template was compiled to disk when the app was created
+            assert 'mako.html.py' in os.listdir(module_directory)
+            assert 'form_name.html.py' in os.listdir(module_directory)
+            
+            r = TestApp(app).get('/')
+            assert r.status_int == 200
+            assert "<h1>Hello, Jonathan!</h1>" in r.body
+        finally:
+            shutil.rmtree(module_directory)
+    
+    def test_jinja_bytecode_cache(self):
+        if 'jinja' not in builtin_renderers:
+            return
+        
+        import shutil, tempfile
+        class RootController(object):
+            @expose('jinja:jinja.html')
+            def index(self, name='Jonathan'):
+                return dict(name=name)
+        
+        bytecode_cache = tempfile.mkdtemp()
+        try:
+            app = Pecan(RootController(), template_path=self.template_path,
+                        template_options={'jinja': dict(
+                            bytecode_cache=bytecode_cache,
+                            cache_size=50,
+                            precompile=['.html']
+                        )})
+            
+            # templates were compiled to the shared cache up front
+            assert len(os.listdir(bytecode_cache)) > 0
+            env = app.renderers.get('jinja', self.template_path).env
+            assert env.cache.capacity == 50
+            assert len(env.cache) > 0
+            
+            r = TestApp(app).get('/')
+            assert r.status_int == 200
+            assert "<h1>Hello, Jonathan!</h1>" in r.body
+        finally:
+            shutil.rmtree(bytecode_cache)
+    
     def test_json(self):
         try:
             from simplejson import loads
@@ -1026,6 +1121,125 @@ class TestEngines(object):
         result = dict(loads(r.body))
         assert result == expected_result
 
+    def test_json_streaming(self):
+        try:
+            from simplejson import loads
+        except:
+            from json import loads
+        
+        expected_result = dict(items=[dict(id=i) for i in range(1000)])
+        
+        class RootController(object):
+            @expose('json')
+            def index(self):
+                return expected_result
+        
+        app = Pecan(
+            RootController(),
+            template_options={'json': {'stream': True, 'chunk_size': 1024}}
+        )
+        r = Request.blank('/').get_response(app)
+        assert r.status_int == 200
+        assert r.content_type == 'application/json'
+        assert r.content_length is None
+        chunks = list(r.app_iter)
+        assert len(chunks) > 1
+        assert loads(''.join(chunks)) == expected_result
+
+    def test_json_streaming_with_request_state(self):
+        try:
+            from simplejson import loads
+        except:
+            from json import loads
+        
+        class Item(object):
+            def __init__(self, id):
+                self.id = id
+            
+            def __json__(self):
+                return dict(id=self.id, path=request.path)
+        
+        class RootController(object):
+            @expose('json')
+            def index(self):
+                return dict(items=iter([Item(i) for i in range(3)]))
+        
+        app = Pecan(
+            RootController(),
+            template_options={'json': {'stream': True}}
+        )
+        r = Request.blank('/').get_response(app)
+        assert r.status_int == 200
+        assert loads(r.body) == dict(
+            items=[dict(id=i, path='/') for i in range(3)]
+        )
+
+    def test_json_streaming_runs_after_hooks_once_sent(self):
+        run = []
+        
+        class RecordingHook(PecanHook):
+            def after(self, state):
+                run.append(('after', state.request.path))
+        
+        def items():
+            for i in range(3):
+                run.append(i)
+                yield dict(id=i)
+        
+        class RootController(object):
+            @expose('json')
+            def index(self):
+                return dict(items=items())
+        
+        app = Pecan(
+            RootController(),
+            hooks=[RecordingHook()],
+            template_options={'json': {'stream': True}}
+        )
+        r = Request.blank('/').get_response(app)
+        assert run == []
+        assert r.body == '{"items": [{"id": 0}, {"id": 1}, {"id": 2}]}'
+        assert run == [0, 1, 2, ('after', '/')]
+
+    def test_json_streaming_error(self):
+        from StringIO import StringIO
+        run = []
+        
+        class RecordingHook(PecanHook):
+            def on_error(self, state, e):
+                run.append(('on_error', str(e)))
+            
+            def after(self, state):
+                run.append('after')
+        
+        def items():
+            yield dict(id=0)
+            raise ValueError('lost the connection')
+        
+        class RootController(object):
+            @expose('json')
+            def index(self):
+                return dict(items=items())
+        
+        app = Pecan(
+            RootController(),
+            hooks=[RecordingHook()],
+            template_options={'json': {'stream': True, 'chunk_size': 1}}
+        )
+        errors = StringIO()
+        req = Request.blank('/', environ={'wsgi.errors': errors})
+        r = req.get_response(app)
+        assert r.status_int == 200
+        try:
+            r.body
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('the error was not raised')
+        r.app_iter.close()
+        assert run == [('on_error', 'lost the connection'), 'after']
+        assert 'the response is incomplete' in errors.getvalue()
+
     def test_override_template(self):
         class RootController(object):
             @expose('foo.html')
@@ -1054,3 +1268,268 @@ class TestEngines(object):
         r = app.get('/')
         assert r.status_int == 200
         assert "<h1>Hello, Jonathan!</h1>" in r.body
+
+
+class TestRouteCache(TestCase):
+    
+    def setUp(self):
+        import pecan.routing
+        self.routing = pecan.routing
+        self._find_object = pecan.routing.find_object
+        self.walks = walks = []
+        def find_object(*args, **kw):
+            walks.append(args[1])
+            return self._find_object(*args, **kw)
+        pecan.routing.find_object = find_object
+    
+    def tearDown(self):
+        self.routing.find_object = self._find_object
+    
+    def test_static_paths_are_cached(self):
+        class SubController(object):
+            @expose()
+            def index(self):
+                return '/sub/'
+            
+            @expose()
+            def deeper(self, arg=None):
+                return '/sub/deeper %s' % arg
+        
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+            
+            sub = SubController()
+        
+        app = TestApp(Pecan(RootController()))
+        for i in range(3):
+            r = app.get('/sub/deeper/1')
+            assert r.status_int == 200
+            assert r.body == '/sub/deeper 1'
+        assert len(self.walks) == 1
+        
+        r = app.get('/sub/')
+        assert r.status_int == 200
+        assert r.body == '/sub/'
+        assert len(self.walks) == 2
+    
+    def test_default_is_cached(self):
+        class RootController(object):
+            @expose()
+            def _default(self, *args):
+                return 'default %s' % '/'.join(args)
+        
+        app = TestApp(Pecan(RootController()))
+        for i in range(3):
+            r = app.get('/a/b')
+            assert r.status_int == 200
+            assert r.body == 'default a/b'
+        assert len(self.walks) == 1
+    
+    def test_lookup_is_not_cached(self):
+        lookups = []
+        
+        class LookupController(object):
+            def __init__(self, someID):
+                self.someID = someID
+            
+            @expose()
+            def index(self):
+                return '/%s' % self.someID
+        
+        class RootController(object):
+            @expose()
+            def _lookup(self, someID, *remainder):
+                lookups.append(someID)
+                return LookupController(someID), remainder
+        
+        app = TestApp(Pecan(RootController()))
+        for i in range(3):
+            r = app.get('/100/')
+            assert r.status_int == 200
+            assert r.body == '/100'
+        assert lookups == ['100', '100', '100']
+    
+    def test_route_is_not_cached(self):
+        routes = []
+        
+        class RootController(object):
+            @expose()
+            def index(self, *args):
+                return 'index %s' % '/'.join(args)
+            
+            @expose()
+            def _route(self, args):
+                routes.append(args)
+                return self.index, args
+        
+        app = TestApp(Pecan(RootController()))
+        for i in range(3):
+            r = app.get('/a/b')
+            assert r.status_int == 200
+            assert r.body == 'index a/b'
+        assert len(routes) == 3
+    
+    def test_disabled(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+        
+        app = TestApp(Pecan(RootController(), route_cache_size=0))
+        for i in range(3):
+            r = app.get('/')
+            assert r.status_int == 200
+        assert len(self.walks) == 3
+    
+    def test_bounded(self):
+        class RootController(object):
+            @expose()
+            def index(self, *args):
+                return '/'.join(args)
+        
+        papp = Pecan(RootController(), route_cache_size=2)
+        app = TestApp(papp)
+        for path in ('/index/a', '/index/b', '/index/c', '/index/a'):
+            r = app.get(path)
+            assert r.status_int == 200
+        assert len(papp.route_cache.routes) == 2
+        assert len(self.walks) == 4
+    
+    def test_notfound_is_cached(self):
+        errors = []
+        
+        class ErrorHook(PecanHook):
+            def on_error(self, state, e):
+                errors.append(e)
+        
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+        
+        papp = Pecan(RootController(), hooks=[ErrorHook()])
+        app = TestApp(papp)
+        for i in range(3):
+            r = app.get('/missing/page', status=404)
+            assert r.status_int == 404
+        assert len(self.walks) == 1
+        assert len(papp.route_cache.misses) == 1
+        assert len(papp.route_cache.routes) == 0
+        assert len(errors) == 3
+        assert isinstance(errors[0], HTTPNotFound)
+
+
+    def test_dynamic_attributes_are_not_cached(self):
+        class V1(object):
+            @expose()
+            def index(self):
+                return 'v1'
+        
+        class V2(object):
+            @expose()
+            def index(self):
+                return 'v2'
+        
+        class Versions(object):
+            def __getattr__(self, name):
+                if name == 'v1':
+                    return V1()
+                if name == 'v2':
+                    return V2()
+                raise AttributeError(name)
+        
+        class RootController(object):
+            versions = Versions()
+            
+            @property
+            def api(self):
+                if request.headers.get('X-Version') == '2':
+                    return V2()
+                return V1()
+        
+        app = TestApp(Pecan(RootController()))
+        assert app.get('/api/').body == 'v1'
+        assert app.get('/api/', headers={'X-Version': '2'}).body == 'v2'
+        assert app.get('/versions/v1/').body == 'v1'
+        assert app.get('/versions/v2/').body == 'v2'
+        assert app.get('/versions/v1/').body == 'v1'
+        assert len(self.walks) == 5
+
+
+class TestConditional(TestCase):
+    
+    def test_etag_from_body(self):
+        class RootController(object):
+            @etag
+            @expose()
+            def index(self):
+                return 'Hello, World!'
+            
+            @expose()
+            def plain(self):
+                return 'Hello, World!'
+        
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/')
+        assert r.status_int == 200
+        tag = r.headers['ETag']
+        
+        r = app.get('/', headers={'If-None-Match': tag})
+        assert r.status_int == 304
+        assert r.body == ''
+        assert r.headers['ETag'] == tag
+        
+        r = app.get('/', headers={'If-None-Match': '"stale"'})
+        assert r.status_int == 200
+        assert r.body == 'Hello, World!'
+        
+        assert 'ETag' not in app.get('/plain').headers
+    
+    def test_app_wide_etag(self):
+        class RootController(object):
+            @expose()
+            def index(self):
+                return 'Hello, World!'
+        
+        app = TestApp(Pecan(RootController(), etag=True))
+        tag = app.get('/').headers['ETag']
+        assert app.get('/', headers={'If-None-Match': tag}).status_int == 304
+        assert app.post('/', headers={'If-None-Match': tag}).status_int == 200
+    
+    def test_conditional_skips_rendering(self):
+        from datetime import datetime
+        calls = []
+        
+        class RootController(object):
+            @expose('json')
+            def index(self):
+                conditional(etag='v1')
+                calls.append('rendered')
+                return dict(version=1)
+            
+            @expose()
+            def modified(self):
+                conditional(last_modified=datetime(2011, 1, 1))
+                calls.append('modified')
+                return 'Hello'
+        
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/')
+        assert r.status_int == 200
+        assert r.headers['ETag'] == '"v1"'
+        
+        r = app.get('/', headers={'If-None-Match': '"v1"'})
+        assert r.status_int == 304
+        assert calls == ['rendered']
+        
+        r = app.get('/modified', headers={
+            'If-Modified-Since': 'Sat, 01 Jan 2011 00:00:00 GMT'
+        })
+        assert r.status_int == 304
+        r = app.get('/modified', headers={
+            'If-Modified-Since': 'Fri, 31 Dec 2010 00:00:00 GMT'
+        })
+        assert r.status_int == 200
+        assert calls == ['rendered', 'modified']
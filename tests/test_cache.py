@@ -0,0 +1,142 @@
+from unittest import TestCase
+from webtest import TestApp
+
+from pecan import Pecan, expose, response
+from pecan.cache import MemoryCache, MemcachedCache
+from pecan.decorators import cached
+
+
+class TestCachedDecorator(TestCase):
+
+    def make_app(self, **kw):
+        calls = self.calls = []
+
+        class RootController(object):
+            @cached(ttl=60)
+            @expose()
+            def index(self, name='World'):
+                calls.append(name)
+                response.set_cookie('visited', 'yes')
+                return 'Hello, %s!' % name
+
+            @cached(ttl=60, vary=['Accept-Language'])
+            @expose()
+            def greeting(self):
+                from pecan import request
+                calls.append('greeting')
+                if request.headers.get('Accept-Language') == 'fr':
+                    return 'Bonjour'
+                return 'Hello'
+
+            @cached(ttl=60)
+            @expose()
+            def missing(self):
+                calls.append('missing')
+                response.status = 404
+                return 'Not Here'
+
+        return TestApp(Pecan(RootController(), **kw))
+
+    def test_hit_skips_controller(self):
+        app = self.make_app()
+        for i in range(3):
+            r = app.get('/')
+            assert r.status_int == 200
+            assert r.body == 'Hello, World!'
+            assert r.content_type == 'text/html'
+        assert self.calls == ['World']
+
+    def test_keyed_by_query_string(self):
+        app = self.make_app()
+        assert app.get('/?name=Joe').body == 'Hello, Joe!'
+        assert app.get('/?name=Ryan').body == 'Hello, Ryan!'
+        assert app.get('/?name=Joe').body == 'Hello, Joe!'
+        assert self.calls == ['Joe', 'Ryan']
+
+    def test_vary(self):
+        app = self.make_app()
+        r = app.get('/greeting', headers={'Accept-Language': 'fr'})
+        assert r.body == 'Bonjour'
+        assert r.headers['Vary'] == 'Accept-Language'
+        assert app.get('/greeting').body == 'Hello'
+        assert app.get('/greeting', headers={'Accept-Language': 'fr'}).body == 'Bonjour'
+        assert self.calls == ['greeting', 'greeting']
+
+    def test_only_successful_gets_are_cached(self):
+        app = self.make_app()
+        app.post('/', dict(name='Joe'))
+        app.post('/', dict(name='Joe'))
+        app.get('/missing', status=404)
+        app.get('/missing', status=404)
+        assert self.calls == ['Joe', 'Joe', 'missing', 'missing']
+
+    def test_cookies_are_not_cached(self):
+        app = self.make_app()
+        assert 'Set-Cookie' in app.get('/').headers
+        assert 'Set-Cookie' not in app.get('/').headers
+
+    def test_hooked_headers_are_not_cached(self):
+        from pecan.hooks import PecanHook
+        requests = []
+
+        class RequestIdHook(PecanHook):
+            def before(self, state):
+                requests.append(state.request.path)
+                state.response.headers['X-Request-Id'] = str(len(requests))
+
+        app = self.make_app(hooks=[RequestIdHook()])
+        for i in range(1, 4):
+            r = app.get('/greeting', headers={'Accept-Language': 'fr'})
+            assert r.body == 'Bonjour'
+            assert r.headers['X-Request-Id'] == str(i)
+            assert r.headers['Vary'] == 'Accept-Language'
+            assert r.content_type == 'text/html'
+            assert r.headers.getall('X-Request-Id') == [str(i)]
+        assert self.calls == ['greeting']
+
+    def test_custom_backend(self):
+        class Client(dict):
+            def set(self, key, value, time=0):
+                self[key] = value
+            def delete(self, key):
+                self.pop(key, None)
+
+        client = Client()
+        app = self.make_app(output_cache=MemcachedCache(client))
+        app.get('/')
+        app.get('/')
+        assert self.calls == ['World']
+        assert len(client) == 1
+        assert client.keys()[0].startswith('pecan:')
+
+
+class TestMemoryCache(TestCase):
+
+    def test_expiry(self):
+        cache = MemoryCache()
+        cache.set('fresh', 'value', 60)
+        cache.set('stale', 'value', -1)
+        cache.set('forever', 'value')
+        assert cache.get('fresh') == 'value'
+        assert cache.get('stale') is None
+        assert cache.get('forever') == 'value'
+        assert 'stale' not in cache
+
+    def test_evicts_by_size(self):
+        cache = MemoryCache(maxbytes=250)
+        cache.set('a', 'x' * 100)
+        cache.set('b', 'x' * 100)
+        cache.get('a')
+        cache.set('c', 'x' * 100)
+        assert cache.get('a') is not None
+        assert cache.get('b') is None
+        assert cache.get('c') is not None
+        assert cache.size == 200
+
+        cache.pop('a')
+        assert cache.size == 100
+
+        # too big to store at all
+        cache.set('d', 'x' * 300)
+        assert 'd' not in cache
+        assert cache.get('c') is not None
@@ -0,0 +1,197 @@
+from gzip import GzipFile
+from mimetypes import guess_type
+from StringIO import StringIO
+from unittest import TestCase
+from webtest import TestApp
+
+from pecan import Pecan, expose, make_app
+from pecan.compression import CompressionMiddleware, parse_accept_encoding
+
+import os
+import shutil
+import tempfile
+import zlib
+
+
+def gunzip(data):
+    return GzipFile(fileobj=StringIO(data)).read()
+
+
+class RootController(object):
+    @expose(content_type='text/plain')
+    def index(self):
+        return 'Hello, World! ' * 100
+
+    @expose(content_type='text/plain')
+    def small(self):
+        return 'Hello, World!'
+
+    @expose(content_type='image/png')
+    def image(self):
+        return '\x89PNG' * 1000
+
+    @expose('json')
+    def stream(self):
+        return dict(items=range(5000))
+
+
+class TestCompression(TestCase):
+
+    def setUp(self):
+        self.app = TestApp(CompressionMiddleware(Pecan(
+            RootController(),
+            template_options={'json': {'stream': True, 'chunk_size': 1024}}
+        )))
+
+    def test_gzip(self):
+        r = self.app.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert r.headers['Vary'] == 'Accept-Encoding'
+        assert int(r.headers['Content-Length']) < 1400
+        assert gunzip(r.body) == 'Hello, World! ' * 100
+
+    def test_deflate(self):
+        r = self.app.get('/', headers={'Accept-Encoding': 'gzip;q=0, deflate'})
+        assert r.headers['Content-Encoding'] == 'deflate'
+        assert zlib.decompress(r.body) == 'Hello, World! ' * 100
+
+    def test_not_accepted(self):
+        r = self.app.get('/')
+        assert 'Content-Encoding' not in r.headers
+        assert r.headers['Vary'] == 'Accept-Encoding'
+        assert r.body == 'Hello, World! ' * 100
+
+    def test_small_and_binary_responses(self):
+        for path in ('/small', '/image'):
+            r = self.app.get(path, headers={'Accept-Encoding': 'gzip'})
+            assert 'Content-Encoding' not in r.headers
+            assert 'Vary' not in r.headers
+
+    def test_streaming(self):
+        from simplejson import loads
+        r = self.app.get('/stream', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert loads(gunzip(r.body)) == dict(items=range(5000))
+
+    def test_head(self):
+        r = self.app.head('/', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert r.body == ''
+
+    def test_start_response_on_first_iteration(self):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            yield 'Hello, World! ' * 100
+
+        app = TestApp(CompressionMiddleware(app))
+        r = app.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert gunzip(r.body) == 'Hello, World! ' * 100
+
+    def test_etag_and_ranges(self):
+        body = 'Hello, World! ' * 100
+
+        def app(environ, start_response):
+            if environ.get('HTTP_IF_NONE_MATCH') == '"v1"':
+                start_response('304 Not Modified', [('ETag', '"v1"')])
+                return []
+            start_response('200 OK', [
+                ('Content-Type', 'text/plain'),
+                ('Content-Length', str(len(body))),
+                ('ETag', '"v1"'),
+                ('Accept-Ranges', 'bytes')
+            ])
+            return [body]
+
+        app = TestApp(CompressionMiddleware(app))
+        r = app.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['ETag'] == 'W/"v1"'
+        assert 'Accept-Ranges' not in r.headers
+
+        r = app.get('/', headers={
+            'Accept-Encoding': 'gzip',
+            'If-None-Match': 'W/"v1"'
+        }, status=304)
+        assert r.headers['ETag'] == 'W/"v1"'
+
+        r = app.get('/')
+        assert r.headers['ETag'] == '"v1"'
+        assert r.headers['Accept-Ranges'] == 'bytes'
+
+    def test_parse_accept_encoding(self):
+        assert parse_accept_encoding('gzip;q=0.5, identity; q=0, *') == {
+            'gzip': 0.5, 'identity': 0.0, '*': 1.0
+        }
+        assert parse_accept_encoding(None) == {}
+
+
+class TestPrecompressedStatic(TestCase):
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        f = open(os.path.join(self.static_root, 'app.js'), 'w')
+        f.write('var x = 1;' * 100)
+        f.close()
+        gz = GzipFile(os.path.join(self.static_root, 'app.js.gz'), 'wb')
+        gz.write('var x = "precompressed";')
+        gz.close()
+        self.app = TestApp(make_app(
+            RootController(),
+            static_root=self.static_root,
+            compression=dict(min_size=100)
+        ))
+
+    def tearDown(self):
+        shutil.rmtree(self.static_root)
+
+    def test_precompressed(self):
+        r = self.app.get('/app.js', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert r.content_type == guess_type('app.js')[0]
+        assert gunzip(r.body) == 'var x = "precompressed";'
+
+    def test_precompressed_headers(self):
+        plain = self.app.get('/app.js')
+        r = self.app.get('/app.js', headers={
+            'Accept-Encoding': 'gzip',
+            'Range': 'bytes=0-9'
+        })
+        assert r.status_int == 200
+        assert r.headers['Vary'] == 'Accept-Encoding'
+        assert r.headers['Cache-Control'] == 'public, max-age=3600'
+        assert 'Last-Modified' in r.headers
+        assert 'Accept-Ranges' not in r.headers
+        assert 'Content-Range' not in r.headers
+        assert r.headers['Content-Length'] == str(len(r.body))
+        assert r.headers['ETag'].endswith('-gzip"')
+        assert r.headers['ETag'] != plain.headers['ETag']
+
+        # each representation is only revalidated by its own tag
+        self.app.get('/app.js', headers={
+            'Accept-Encoding': 'gzip',
+            'If-None-Match': r.headers['ETag']
+        }, status=304)
+        self.app.get('/app.js', headers={
+            'Accept-Encoding': 'gzip',
+            'If-None-Match': plain.headers['ETag']
+        }, status=200)
+
+    def test_precompressed_fingerprinted(self):
+        from pecan.static import fingerprint
+        path = fingerprint('/app.js', self.static_root)
+        r = self.app.get(path, headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert r.headers['Cache-Control'] == 'public, max-age=31536000'
+        assert gunzip(r.body) == 'var x = "precompressed";'
+
+    def test_uncompressed_fallback(self):
+        r = self.app.get('/app.js')
+        assert 'Content-Encoding' not in r.headers
+        assert r.headers['Vary'] == 'Accept-Encoding'
+        assert r.headers['Accept-Ranges'] == 'bytes'
+        assert r.body == 'var x = 1;' * 100
+
+    def test_application_responses(self):
+        r = self.app.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['Content-Encoding'] == 'gzip'
+        assert gunzip(r.body) == 'Hello, World! ' * 100
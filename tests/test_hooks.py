@@ -1,7 +1,7 @@
 from cStringIO           import StringIO
-from pecan               import make_app, expose, request, redirect
+from pecan               import make_app, expose, request, redirect, Pecan
 from pecan.core          import state
-from pecan.hooks         import PecanHook, TransactionHook, HookController, RequestViewerHook
+from pecan.hooks         import PecanHook, TransactionHook, HookController, RequestViewerHook, HookChain
 from pecan.configuration import Config
 from pecan.decorators    import transactional, after_commit
 from formencode          import Schema, validators
@@ -325,6 +325,80 @@ class TestHooks(object):
         assert run_hook[3] == 'inside_sub'
         assert run_hook[4] == 'after1'
         assert run_hook[5] == 'after2'
+
+    def test_hook_chains_are_cached(self):
+        class SimpleHook(PecanHook):
+            def __init__(self, id):
+                self.id = id
+        
+        class SubController(HookController):
+            __hooks__ = [SimpleHook(2)]
+            
+            @expose()
+            def index(self):
+                return 'Inside here!'
+        
+        class RootController(object):
+            @expose()
+            def index(self):
+                return 'Hello, World!'
+            
+            sub = SubController()
+        
+        root = RootController()
+        papp = Pecan(root, hooks=[SimpleHook(1)])
+        
+        hooks = papp.determine_hooks()
+        assert [h.id for h in hooks] == [1]
+        assert papp.determine_hooks() is hooks
+        
+        sub_hooks = papp.determine_hooks(root.sub.index)
+        assert [h.id for h in sub_hooks] == [2, 1]
+        assert papp.determine_hooks(root.sub.index) is sub_hooks
+        
+        # adding a hook invalidates the cached chains
+        papp.hooks.append(SimpleHook(3))
+        assert [h.id for h in papp.determine_hooks()] == [1, 3]
+        assert [h.id for h in papp.determine_hooks(root.sub.index)] == [2, 1, 3]
+        
+        # as does changing a priority
+        papp.hooks[1].priority = 1
+        assert [h.id for h in papp.determine_hooks()] == [3, 1]
+        assert [h.id for h in papp.determine_hooks(root.sub.index)] == [3, 2, 1]
+        
+        # as does replacing a hook, even if the number of hooks is the same
+        papp.hooks[0] = SimpleHook(4)
+        assert [h.id for h in papp.determine_hooks()] == [3, 4]
+        papp.hooks.remove(papp.hooks[0])
+        papp.hooks.append(SimpleHook(5))
+        assert [h.id for h in papp.determine_hooks()] == [3, 5]
+        assert [h.id for h in papp.determine_hooks(root.sub.index)] == [3, 2, 5]
+    
+    def test_hook_chain_phases(self):
+        class AfterHook(PecanHook):
+            priority = 1
+            def after(self, state):
+                pass
+        
+        class ErrorHook(AfterHook):
+            priority = 2
+            def on_error(self, state, e):
+                pass
+        
+        class DuckHook(object):
+            priority = 3
+            def on_route(self, state):
+                pass
+        
+        after, error, duck, empty = AfterHook(), ErrorHook(), DuckHook(), PecanHook()
+        empty.before = lambda state: None
+        
+        chain = HookChain([after, error, duck, empty])
+        assert list(chain) == [after, error, duck, empty]
+        assert chain.phases['on_route'] == [duck]
+        assert chain.phases['before'] == [duck, empty]
+        assert chain.phases['after'] == [duck, error, after]
+        assert chain.phases['on_error'] == [duck, error]
     
     def test_hooks_with_validation(self):
         run_hook = []
@@ -1062,6 +1136,71 @@ class TestTransactionHook(object):
         assert run_hook[1] == 'inside'
         assert run_hook[2] == 'commit'
         assert run_hook[3] == 'clear'
+
+    def test_transaction_hook_with_streamed_result(self):
+        from webob import Request
+        from pecan.jsonify import ResultProxy
+        run_hook = []
+        
+        class FakeResultProxy(ResultProxy):
+            rowcount = -1
+            
+            def __init__(self, rows, fail=False):
+                self.rows = rows
+                self.fail = fail
+            
+            def fetchmany(self, size):
+                if self.fail and not self.rows:
+                    raise ValueError('the connection was lost')
+                run_hook.append('fetch')
+                rows, self.rows = self.rows[:size], self.rows[size:]
+                return rows
+            
+            def close(self):
+                run_hook.append('close')
+        
+        class RootController(object):
+            @expose('json')
+            def index(self, fail=False):
+                run_hook.append('inside')
+                return dict(rows=FakeResultProxy([1, 2, 3], bool(fail)))
+        
+        def gen(event):
+            return lambda: run_hook.append(event)
+        
+        app = make_app(
+            RootController(),
+            hooks=[
+                TransactionHook(
+                    start    = gen('start'),
+                    start_ro = gen('start_ro'),
+                    commit   = gen('commit'),
+                    rollback = gen('rollback'),
+                    clear    = gen('clear')
+                )
+            ],
+            template_options={'json': {'stream': True, 'fetch_size': 2}}
+        )
+        
+        # the result is read before the transaction is committed and cleared
+        response = Request.blank('/', method='POST').get_response(app)
+        assert response.status_int == 200
+        assert run_hook == ['start', 'inside']
+        assert response.body == '{"rows": {"rows": [1, 2, 3], "count": 3}}'
+        assert run_hook == [
+            'start', 'inside', 'fetch', 'fetch', 'fetch', 'close',
+            'commit', 'clear'
+        ]
+        
+        # errors while the result is read roll the transaction back
+        run_hook = []
+        response = Request.blank('/?fail=1', method='POST', environ={
+            'wsgi.errors': StringIO()
+        }).get_response(app)
+        assert 'Server Error' in response.body
+        assert run_hook == [
+            'start', 'inside', 'fetch', 'fetch', 'close', 'rollback', 'clear'
+        ]
         
 
 class TestRequestViewerHook(object):
@@ -11,8 +11,10 @@ except ImportError:
     create_engine = None
 from unittest              import TestCase
 
-from pecan.jsonify         import jsonify, encode, ResultProxy, RowProxy
+from pecan.jsonify         import jsonify, encode, iterencode, ResultProxy, RowProxy
+from pecan.jsonify         import get_backend, register_backend
 from pecan                 import Pecan, expose, request
+from formencode            import Schema, validators
 from webtest               import TestApp
 from webob.multidict       import MultiDict, UnicodeMultiDict
 
@@ -83,6 +85,36 @@ class TestJsonifyGenericEncoder(TestCase):
         result = encode(JsonCallable('foo'))
         assert loads(result) == {'arg':'foo'}
 
+    def test_encoder_resolved_once_per_class(self):
+        from pecan.jsonify import _encoders
+
+        class Foo(object):
+            def __init__(self, value):
+                self.value = value
+            def __json__(self):
+                return dict(value=self.value)
+
+        assert loads(encode([Foo(1), Foo(2)])) == [{'value': 1}, {'value': 2}]
+        assert Foo in _encoders
+
+        # rules registered later still take precedence
+        @jsonify.when_type(Foo)
+        def jsonify_foo(obj):
+            return obj.value
+        assert loads(encode([Foo(1), Foo(2)])) == [1, 2]
+
+        class Bar(object):
+            def __json__(self):
+                return 'bar'
+
+        special = Bar()
+        assert loads(encode([Bar(), special])) == ['bar', 'bar']
+
+        @jsonify.when_object(special)
+        def jsonify_special(obj):
+            return 'special'
+        assert loads(encode([Bar(), special])) == ['bar', 'special']
+
     def test_datetime(self):
         today = date.today()
         now = datetime.now()
@@ -112,6 +144,21 @@ class TestJsonifyGenericEncoder(TestCase):
 
         self.assertRaises(TypeError, encode, Foo())
 
+    def test_generator(self):
+        def rows():
+            for i in range(3):
+                yield dict(id=i)
+        expected = [{'id': 0}, {'id': 1}, {'id': 2}]
+        assert loads(encode(rows())) == expected
+        assert loads(''.join(iterencode(dict(rows=rows())))) == dict(rows=expected)
+
+    def test_iterencode(self):
+        data = dict(items=[dict(id=i, when=date(2010, 1, 1)) for i in range(100)])
+        chunks = list(iterencode(data, chunk_size=256))
+        assert len(chunks) > 1
+        assert all(len(chunk) >= 256 for chunk in chunks[:-1])
+        assert ''.join(chunks) == encode(data)
+
 class TestJsonifySQLAlchemyGenericEncoder(TestCase):
     
     def setUp(self):
@@ -136,8 +183,14 @@ class TestJsonifySQLAlchemyGenericEncoder(TestCase):
             def __init__(self):
                 self.rowcount = -1
                 self.rows = []
+                self.fetches = []
             def __iter__(self):
                 return iter(self.rows)
+            def fetchmany(self, size):
+                start = sum(self.fetches)
+                rows = self.rows[start:start + size]
+                self.fetches.append(len(rows))
+                return rows
             def append(self, row):
                 self.rows.append(row)
         
@@ -191,6 +244,16 @@ class TestJsonifySQLAlchemyGenericEncoder(TestCase):
         result = encode(self.sa_object)
         assert loads(result) == {'id': 1, 'first_name': 'Jonathan', 'last_name': 'LaCour'}
     
+    def test_sa_object_unmapped_attributes(self):
+        self.sa_object.display_name = 'Jonathan LaCour'
+        result = encode(self.sa_object)
+        assert loads(result) == {
+            'id': 1,
+            'first_name': 'Jonathan',
+            'last_name': 'LaCour',
+            'display_name': 'Jonathan LaCour'
+        }
+    
     def test_result_proxy(self):
         result = encode(self.result_proxy)
         assert loads(result) == {'count': 2, 'rows': [
@@ -198,6 +261,73 @@ class TestJsonifySQLAlchemyGenericEncoder(TestCase):
             {'id': 2, 'first_name': 'Yoann', 'last_name': 'Roman'}
         ]}
     
+    def test_result_proxy_iterencode(self):
+        result = ''.join(iterencode(self.result_proxy, fetch_size=1))
+        assert loads(result) == {'count': 2, 'rows': [
+            {'id': 1, 'first_name': 'Jonathan', 'last_name': 'LaCour'},
+            {'id': 2, 'first_name': 'Yoann', 'last_name': 'Roman'}
+        ]}
+        if hasattr(self.result_proxy, 'fetches'):
+            assert self.result_proxy.fetches == [1, 1, 0]
+    
     def test_row_proxy(self):
         result = encode(self.row_proxy)
         assert loads(result) == {'id': 1, 'first_name': 'Jonathan', 'last_name': 'LaCour'}
+
+
+class TestJsonBackends(TestCase):
+    
+    def test_backends_use_jsonify_rules(self):
+        Person = make_person()
+        
+        @jsonify.when_type(Person)
+        def jsonify_person(obj):
+            return dict(name=obj.name)
+        
+        data = dict(
+            person=Person('Jonathan', 'LaCour'),
+            when=date(2011, 1, 1),
+            params=MultiDict(arg='foo')
+        )
+        expected = dict(
+            person=dict(name='Jonathan LaCour'),
+            when='2011-01-01',
+            params=dict(arg='foo')
+        )
+        for name in ('json', 'simplejson'):
+            backend = get_backend(name)
+            assert loads(backend.encode(data)) == expected
+            assert loads(''.join(backend.iterencode(data))) == expected
+    
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, get_backend, 'missing')
+        self.assertRaises(ValueError, Pecan, object(), json_backend='missing')
+    
+    def test_app_backend(self):
+        import json
+        calls = []
+        
+        def dumps(obj, **kw):
+            calls.append('dumps')
+            return json.dumps(obj, **kw)
+        
+        def loads(s):
+            calls.append('loads')
+            return json.loads(s)
+        
+        register_backend('recording', dumps, loads)
+        
+        class NameSchema(Schema):
+            name = validators.String(not_empty=True)
+        
+        class RootController(object):
+            @expose('json', json_schema=NameSchema())
+            def index(self, data):
+                return data
+        
+        app = TestApp(Pecan(RootController(), json_backend='recording'))
+        r = app.post('/', json.dumps(dict(name='Pecan')),
+                     [('content-type', 'application/json')])
+        assert r.status_int == 200
+        assert json.loads(r.body) == dict(name='Pecan')
+        assert calls == ['loads', 'dumps']
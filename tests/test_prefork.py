@@ -0,0 +1,59 @@
+from unittest import TestCase
+from pecan.prefork import PreforkServer
+
+import os
+import signal
+import time
+import urllib2
+
+
+def application(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid())]
+
+
+class TestPreforkServer(TestCase):
+
+    def start(self, **kw):
+        server = PreforkServer(application, '127.0.0.1', 0, **kw)
+        pid = os.fork()
+        if not pid:
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        server.socket.close()
+        self.master = pid
+        self.url = 'http://127.0.0.1:%d/' % server.server_address[1]
+
+    def tearDown(self):
+        os.kill(self.master, signal.SIGTERM)
+        os.waitpid(self.master, 0)
+
+    def get(self):
+        return int(urllib2.urlopen(self.url, timeout=10).read())
+
+    def test_workers_are_forked(self):
+        self.start(workers=2)
+        pids = set(self.get() for i in range(10))
+        assert self.master not in pids
+        assert 1 <= len(pids) <= 2
+
+    def test_max_requests(self):
+        self.start(workers=1, max_requests=2)
+        pids = [self.get() for i in range(6)]
+        assert pids[0] == pids[1]
+        assert len(set(pids)) == 3
+
+    def test_graceful_restart(self):
+        self.start(workers=1)
+        before = self.get()
+        os.kill(self.master, signal.SIGHUP)
+        # the old worker can still accept requests until it notices the
+        # signal, so wait for it to go away
+        for i in range(50):
+            after = self.get()
+            if after != before:
+                break
+            time.sleep(0.1)
+        assert after != before
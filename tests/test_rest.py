@@ -886,3 +886,119 @@ class TestRestController(object):
         r = app.post('/users/1?_method=delete')
         assert r.status_int == 200
         assert r.body == "FORM VALIDATION FAILED"
+    
+    def test_method_override_without_reading_body(self):
+        
+        class ThingsController(RestController):
+            
+            @expose()
+            def post(self):
+                return 'POST'
+            
+            @expose()
+            def put(self, id):
+                return 'PUT %s' % id
+        
+        class RootController(object):
+            things = ThingsController()
+        
+        app = TestApp(make_app(RootController()))
+        
+        # the X-HTTP-Method-Override header
+        r = app.post('/things/1', headers={'X-HTTP-Method-Override': 'PUT'})
+        assert r.body == 'PUT 1'
+        
+        # the query string takes precedence over the header
+        r = app.post('/things/1?_method=put', headers={
+            'X-HTTP-Method-Override': 'DELETE'
+        })
+        assert r.body == 'PUT 1'
+        
+        # small form-encoded bodies are still checked
+        r = app.post('/things/1', {'_method': 'put'})
+        assert r.body == 'PUT 1'
+        
+        # but uploads aren't parsed while routing
+        r = app.post('/things', {'_method': 'put'},
+                     upload_files=[('file', 'data.txt', 'x' * 100)])
+        assert r.body == 'POST'
+        
+        # nor are large form-encoded bodies
+        limit = RestController._method_body_limit
+        RestController._method_body_limit = 10
+        try:
+            r = app.post('/things', {'_method': 'put', 'data': 'x' * 100})
+            assert r.body == 'POST'
+        finally:
+            RestController._method_body_limit = limit
+    
+    def test_dispatch_table(self):
+        from pecan.rest import _dispatch_tables
+        
+        class BarsController(RestController):
+            
+            @expose()
+            def get_one(self, foo_id, id):
+                return 'BAR %s %s' % (foo_id, id)
+        
+        class FoosController(RestController):
+            
+            _custom_actions = {'reset': ['POST']}
+            
+            def __init__(self):
+                # sub-controllers assigned to instances are still found
+                self.bars = BarsController()
+            
+            @expose()
+            def get_one(self, id):
+                return 'FOO %s' % id
+            
+            @expose()
+            def post_reset(self, id):
+                return 'RESET %s' % id
+        
+        class RootController(object):
+            foos = FoosController()
+        
+        app = TestApp(make_app(RootController()))
+        assert app.get('/foos/1').body == 'FOO 1'
+        assert app.get('/foos/1/bars/2').body == 'BAR 1 2'
+        assert app.post('/foos/1/reset').body == 'RESET 1'
+        app.get('/foos/1/reset', status=404)
+        
+        table = _dispatch_tables[FoosController]
+        assert table.verbs['get_one'] == 'get_one'
+        assert table.actions == {('POST', 'reset'): 'post_reset'}
+        assert table.fixed_args == 1
+        assert 'get_one' in table.exposed
+
+    def test_handlers_set_on_instances(self):
+        
+        class ThingsController(RestController):
+            
+            def __init__(self):
+                # handlers and custom actions chosen for each instance
+                self._custom_actions = {'archive': ['POST']}
+                self.get_all = self.list_things
+                self.post_archive = self.archive_thing
+            
+            @expose()
+            def list_things(self):
+                return 'ALL'
+            
+            @expose()
+            def archive_thing(self, id):
+                return 'ARCHIVED %s' % id
+            
+            @expose()
+            def post(self):
+                return 'CREATED'
+        
+        class RootController(object):
+            things = ThingsController()
+        
+        app = TestApp(make_app(RootController()))
+        assert app.get('/things').body == 'ALL'
+        assert app.post('/things').body == 'CREATED'
+        assert app.post('/things/1/archive').body == 'ARCHIVED 1'
+        app.put('/things/1/archive', status=404)
@@ -370,3 +370,225 @@ class TestObjectPathSecurity(TestCase):
         response = self.app.get('/notsecret/unlocked/')
         assert response.status_int == 200
         assert response.body == 'Index unlocked'
+
+
+class TestSecureRouteCache(object):
+    def test_security_replayed_for_cached_routes(self):
+        checks = []
+        authorized = [True]
+
+        class SubController(object):
+            @expose()
+            def index(self):
+                return 'Sub'
+
+        class SecretController(SecureController):
+            @expose()
+            def index(self):
+                return 'Index'
+
+            sub = SubController()
+
+            @classmethod
+            def check_permissions(cls):
+                checks.append(1)
+                return authorized[0]
+
+        class RootController(object):
+            secret = SecretController()
+
+        app = TestApp(make_app(RootController()))
+        for path in ('/secret/', '/secret/sub/'):
+            authorized[0] = True
+            response = app.get(path)
+            assert response.status_int == 200
+            response = app.get(path)
+            assert response.status_int == 200
+
+            authorized[0] = False
+            response = app.get(path, expect_errors=True)
+            assert response.status_int == 401
+        assert len(checks) == 6
+
+
+class TestPermissionMemoization(TestCase):
+
+    def setUp(self):
+        checks = self.checks = []
+
+        def authenticated():
+            checks.append('authenticated')
+            return True
+
+        class LeafController(object):
+            @expose()
+            def index(self):
+                return 'Leaf'
+
+        class BranchController(object):
+            leaf = secure(LeafController(), authenticated)
+
+        class AdminController(SecureController):
+            @expose()
+            def index(self):
+                return 'Admin'
+
+            @classmethod
+            def check_permissions(cls):
+                checks.append('admin')
+                return True
+
+        class RootController(object):
+            branch = secure(BranchController(), authenticated)
+            admin = AdminController()
+
+        self.root = RootController()
+
+    def test_checked_once_per_request(self):
+        app = TestApp(make_app(self.root))
+        assert app.get('/branch/leaf/').body == 'Leaf'
+        assert self.checks == ['authenticated']
+        assert app.get('/branch/leaf/').body == 'Leaf'
+        assert self.checks == ['authenticated', 'authenticated']
+
+    def test_shared_between_requests(self):
+        from pecan.secure import PermissionCache
+
+        class LeafController(object):
+            @expose()
+            def index(self):
+                return 'Leaf'
+
+        class BranchController(object):
+            leaf = secure(LeafController(), shared_authenticated)
+
+        class RootController(object):
+            branch = secure(BranchController(), shared_authenticated)
+            admin = SharedAdminController()
+
+        del shared_checks[:]
+        app = TestApp(make_app(
+            RootController(),
+            permission_cache=PermissionCache(ttl=60)
+        ))
+        for i in range(3):
+            app.get('/branch/leaf/', extra_environ={'REMOTE_USER': 'joe'})
+            app.get('/admin/', extra_environ={'REMOTE_USER': 'joe'})
+        assert shared_checks == ['authenticated', 'admin']
+
+        # other principals are checked separately
+        app.get('/admin/', extra_environ={'REMOTE_USER': 'ryan'})
+        assert shared_checks == ['authenticated', 'admin', 'admin']
+
+        # and anonymous requests are always checked
+        app.get('/admin/')
+        app.get('/admin/')
+        assert shared_checks == ['authenticated', 'admin', 'admin', 'admin', 'admin']
+
+    def test_checks_with_the_same_name_are_not_shared(self):
+        from pecan.secure import PermissionCache
+        roles = {'joe': ['user']}
+
+        def require(role):
+            def check():
+                from pecan import request
+                return role in roles[request.environ['REMOTE_USER']]
+            return check
+
+        class SubController(object):
+            @expose()
+            def index(self):
+                return 'Sub'
+
+        class RootController(object):
+            admin = secure(SubController(), require('admin'))
+            user = secure(SubController(), require('user'))
+            anything = secure(SubController(), lambda: True)
+            nothing = secure(SubController(), lambda: False)
+
+        app = TestApp(make_app(
+            RootController(),
+            permission_cache=PermissionCache(ttl=60)
+        ))
+        joe = {'REMOTE_USER': 'joe'}
+        for i in range(2):
+            assert app.get('/user/', extra_environ=joe).status_int == 200
+            app.get('/admin/', extra_environ=joe, status=401)
+            assert app.get('/anything/', extra_environ=joe).status_int == 200
+            app.get('/nothing/', extra_environ=joe, status=401)
+
+
+# checks are only shared between requests when they can be found by their
+# qualified name
+shared_checks = []
+
+
+def shared_authenticated():
+    shared_checks.append('authenticated')
+    return True
+
+
+class SharedAdminController(SecureController):
+    @expose()
+    def index(self):
+        return 'Admin'
+
+    @classmethod
+    def check_permissions(cls):
+        shared_checks.append('admin')
+        return True
+
+
+class TestSecureBoundaries(TestCase):
+
+    def test_unlocked_by_identity(self):
+        class Touchy(object):
+            def __eq__(self, other):
+                raise AssertionError('unlocked attributes are compared by identity')
+
+            @expose()
+            def index(self):
+                return 'Touchy'
+
+        class SecretController(SecureController):
+            touchy = unlocked(Touchy())
+            other = Touchy()
+
+            @classmethod
+            def check_permissions(cls):
+                return False
+
+        class RootController(object):
+            secret = SecretController()
+
+        app = TestApp(make_app(RootController()))
+        assert app.get('/secret/touchy/').body == 'Touchy'
+        app.get('/secret/other/', status=401)
+
+    def test_parent_bound_per_request(self):
+        class FileController(object):
+            @expose()
+            def index(self):
+                return 'File'
+
+        shared = secure(FileController(), 'may_read')
+
+        class FolderController(object):
+            def __init__(self, readable):
+                self.readable = readable
+                self.files = shared
+
+            def may_read(self):
+                return self.readable
+
+        class RootController(object):
+            public = FolderController(True)
+            private = FolderController(False)
+
+        app = TestApp(make_app(RootController()))
+        for i in range(2):
+            assert app.get('/public/files/').body == 'File'
+            app.get('/private/files/', status=401)
+
+        # routing never modifies the shared wrapper
+        assert shared.parent is None
@@ -1,4 +1,5 @@
 import os
+from unittest import TestCase
 from pecan import expose, make_app
 from webtest import TestApp
 
@@ -23,3 +24,153 @@ class TestStatic(object):
         response = app.get('/text.txt')
         assert response.status_int == 200
         assert response.body == open(text, 'rb').read()
+
+
+class TestStaticFileMiddleware(TestCase):
+
+    def setUp(self):
+        import tempfile
+        from pecan.static import StaticFileMiddleware
+        self.static_root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.static_root, 'css'))
+        self.write('css/style.css', 'body { color: red; }')
+        self.write('big.txt', 'x' * 100000)
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return ['from the app']
+
+        self.middleware = StaticFileMiddleware(app, self.static_root)
+        self.app = TestApp(self.middleware)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.static_root)
+
+    def write(self, name, data):
+        f = open(os.path.join(self.static_root, name), 'wb')
+        f.write(data)
+        f.close()
+
+    def test_matches_by_prefix(self):
+        assert self.app.get('/').body == 'from the app'
+        assert self.app.get('/cssx/style.css').body == 'from the app'
+        assert self.app.get('/css/missing.css').body == 'from the app'
+        assert self.app.get('/css/../../etc/passwd').body == 'from the app'
+        assert self.app.post('/css/style.css').body == 'from the app'
+
+        # new entries at the top of static_root are picked up, once it's
+        # checked again
+        self.write('robots.txt', 'User-agent: *')
+        stat = os.stat(self.static_root)
+        os.utime(self.static_root, (stat.st_atime, stat.st_mtime + 10))
+        assert self.app.get('/robots.txt').body == 'from the app'
+        self.middleware.check_interval = 0
+        assert self.app.get('/robots.txt').body == 'User-agent: *'
+
+    def test_static_root_is_checked_once_per_interval(self):
+        stats = []
+        real_stat = os.stat
+
+        def stat(path):
+            if path == self.static_root:
+                stats.append(path)
+            return real_stat(path)
+
+        os.stat = stat
+        try:
+            for i in range(5):
+                assert self.app.get('/hello').body == 'from the app'
+        finally:
+            os.stat = real_stat
+        assert len(stats) == 1
+
+    def test_missing_static_root(self):
+        from pecan.static import StaticFileMiddleware
+        app = TestApp(StaticFileMiddleware(
+            self.middleware.app,
+            os.path.join(self.static_root, 'missing')
+        ))
+        assert app.get('/hello').body == 'from the app'
+
+    def test_headers(self):
+        r = self.app.get('/css/style.css')
+        assert r.body == 'body { color: red; }'
+        assert r.content_type == 'text/css'
+        assert r.headers['Cache-Control'] == 'public, max-age=3600'
+        assert r.headers['ETag']
+        assert r.headers['Last-Modified']
+        assert r.headers['Content-Length'] == str(len(r.body))
+
+    def test_conditional(self):
+        r = self.app.get('/css/style.css')
+        r = self.app.get('/css/style.css', headers={
+            'If-None-Match': r.headers['ETag']
+        }, status=304)
+        assert r.body == ''
+        r = self.app.get('/css/style.css', headers={
+            'If-Modified-Since': r.headers['Last-Modified']
+        }, status=304)
+        self.app.get('/css/style.css', headers={
+            'If-None-Match': '"other"'
+        }, status=200)
+
+    def test_range(self):
+        r = self.app.get('/big.txt', headers={'Range': 'bytes=10-19'}, status=206)
+        assert r.body == 'x' * 10
+        assert r.headers['Content-Range'] == 'bytes 10-19/100000'
+        r = self.app.get('/big.txt', headers={'Range': 'bytes=-5'}, status=206)
+        assert r.headers['Content-Range'] == 'bytes 99995-99999/100000'
+        self.app.get('/big.txt', headers={'Range': 'bytes=200000-'}, status=416)
+        r = self.app.get('/big.txt', headers={'Range': 'bytes=0-0'}, status=206)
+        assert r.headers['Content-Range'] == 'bytes 0-0/100000'
+        assert r.body == 'x'
+
+    def test_file_wrapper(self):
+        wrapped = []
+
+        def file_wrapper(f, block_size):
+            wrapped.append(f.name)
+            return iter(lambda: f.read(block_size), '')
+
+        r = self.app.get('/big.txt', extra_environ={
+            'wsgi.file_wrapper': file_wrapper
+        })
+        assert len(r.body) == 100000
+        assert wrapped == [os.path.join(self.static_root, 'big.txt')]
+
+    def test_small_files_are_kept_in_memory(self):
+        self.app.get('/css/style.css')
+        self.app.get('/big.txt')
+        filename = os.path.join(self.static_root, 'css', 'style.css')
+        assert filename in self.middleware.cache
+        assert os.path.join(self.static_root, 'big.txt') not in self.middleware.cache
+
+        # changes on disk are noticed
+        self.write('css/style.css', 'body { color: blue; }')
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+        assert self.app.get('/css/style.css').body == 'body { color: blue; }'
+
+    def test_fingerprinted(self):
+        from pecan.static import fingerprint
+        path = fingerprint('/css/style.css', self.static_root)
+        assert path != '/css/style.css'
+        r = self.app.get(path)
+        assert r.body == 'body { color: red; }'
+        assert r.headers['Cache-Control'] == 'public, max-age=31536000'
+
+        # an out of date fingerprint isn't served
+        assert self.app.get('/css/style.00000000.css').body == 'from the app'
+        filename = os.path.join(self.static_root, 'css', 'style.css')
+        assert filename in self.middleware.digests
+
+    def test_explicit_prefix(self):
+        from pecan.static import StaticFileMiddleware
+        app = TestApp(StaticFileMiddleware(
+            lambda environ, start_response: None,
+            self.static_root,
+            prefix='/static'
+        ))
+        assert app.get('/static/css/style.css').body == 'body { color: red; }'
+        app.get('/static/css/missing.css', status=404)
@@ -26,3 +26,143 @@ class TestTemplate(TestCase):
 
         self.assertEqual(extra_vars.make_ns({'bar':2}), {'foo':1, 'bar':2})
         self.assertEqual(extra_vars.make_ns({'foo':2}), {'foo':2})
+
+    def test_error_formatters_ignore_other_errors(self):
+        from pecan.templating import error_formatters
+        for formatter in error_formatters:
+            self.assertEqual(formatter(ValueError('not a template error')), None)
+
+    def test_reload_passed_to_builtin_renderers(self):
+        from pecan.templating import _builtin_renderers
+        rf = RendererFactory(reload=False)
+        if 'genshi' in _builtin_renderers:
+            self.assertFalse(rf.get('genshi', '/').loader.auto_reload)
+        if 'mako' in _builtin_renderers:
+            self.assertFalse(rf.get('mako', '/').loader.filesystem_checks)
+        if 'kajiki' in _builtin_renderers:
+            self.assertFalse(rf.get('kajiki', '/').loader._reload)
+        if 'jinja' in _builtin_renderers:
+            self.assertFalse(rf.get('jinja', '/').env.auto_reload)
+
+    def test_reload_not_passed_to_custom_renderers(self):
+        class CustomRenderer(object):
+            def __init__(self, path, extra_vars):
+                pass
+
+        rf = RendererFactory({'custom': CustomRenderer}, reload=False)
+        self.assertTrue(isinstance(rf.get('custom', '/'), CustomRenderer))
+
+    def test_make_app_reload_follows_debug(self):
+        from pecan import make_app, expose
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+        apps = []
+        def wrap_app(app):
+            apps.append(app)
+            return app
+
+        make_app(RootController(), debug=False, wrap_app=wrap_app)
+        make_app(RootController(), debug=True, wrap_app=wrap_app)
+        self.assertFalse(apps[0].renderers.reload)
+        self.assertTrue(apps[1].renderers.reload)
+
+    def test_extra_vars_layers(self):
+        extra_vars = self.rf.extra_vars
+        extra_vars.update({'foo': 1, 'baz': 3})
+        ns = {'foo': 2, 'bar': 2}
+
+        layered = extra_vars.make_layers(ns)
+        self.assertEqual(layered['foo'], 2)
+        self.assertEqual(layered['baz'], 3)
+        self.assertTrue('bar' in layered)
+        self.assertFalse('missing' in layered)
+        self.assertEqual(sorted(layered.keys()), ['bar', 'baz', 'foo'])
+
+        # later changes to the underlying namespaces show through
+        ns['late'] = True
+        self.assertTrue(layered['late'])
+
+        # writes don't leak into the underlying namespaces
+        layered['written'] = 1
+        self.assertEqual(layered['written'], 1)
+        self.assertFalse('written' in ns)
+        self.assertFalse('written' in extra_vars.namespace)
+
+    def test_layered_namespace_kwargs(self):
+        from pecan.templating import LayeredNamespace
+
+        def render(**kw):
+            return kw
+
+        layered = LayeredNamespace({'a': 1}, LayeredNamespace({'a': 2, 'b': 2}))
+        self.assertEqual(render(**layered), {'a': 1, 'b': 2})
+        self.assertEqual(dict(layered), {'a': 1, 'b': 2})
+        self.assertEqual(layered.copy(), {'a': 1, 'b': 2})
+
+    def test_make_ns_returns_a_dict(self):
+        from simplejson import dumps
+
+        ns = {'a': 1}
+        self.assertTrue(self.rf.extra_vars.make_ns(ns) is ns)
+
+        self.rf.extra_vars.update({'extra': 3})
+        merged = self.rf.extra_vars.make_ns(ns)
+        self.assertEqual(type(merged), dict)
+        self.assertEqual(merged, {'a': 1, 'extra': 3})
+        self.assertEqual(dumps(merged, sort_keys=True), '{"a": 1, "extra": 3}')
+
+    def test_helpers_are_layered_only_for_layered_renderers(self):
+        from pecan import Pecan
+        from pecan.templating import LayeredNamespace
+
+        seen = []
+
+        class FlatRenderer(object):
+            def __init__(self, path, extra_vars):
+                self.extra_vars = extra_vars
+
+            def render(self, template_path, namespace):
+                seen.append(self.extra_vars.make_ns(namespace))
+                return ''
+
+        class LayeredRenderer(FlatRenderer):
+            layered = True
+
+        app = Pecan(object(), custom_renderers={
+            'flat': FlatRenderer,
+            'layers': LayeredRenderer
+        })
+        app.render('flat:index.html', {'a': 1})
+        app.render('layers:index.html', {'a': 1})
+        self.assertEqual(type(seen[0]), dict)
+        self.assertTrue('error_for' in seen[0])
+        self.assertTrue(isinstance(seen[1], LayeredNamespace))
+        self.assertTrue('error_for' in seen[1])
+
+    def test_register_finds_zipped_engines(self):
+        import os
+        import shutil
+        import sys
+        import tempfile
+        import zipfile
+        from pecan.templating import _register, _builtin_renderers
+
+        tmp = tempfile.mkdtemp()
+        try:
+            archive = os.path.join(tmp, 'engine.zip')
+            z = zipfile.ZipFile(archive, 'w')
+            z.writestr('zippedengine/__init__.py', '')
+            z.close()
+            sys.path.insert(0, archive)
+            try:
+                _register('zipped', object, 'zippedengine')
+                self.assertTrue(_builtin_renderers.pop('zipped') is object)
+                self.assertFalse('zippedengine' in sys.modules)
+            finally:
+                sys.path.remove(archive)
+        finally:
+            shutil.rmtree(tmp)
@@ -9,3 +9,26 @@ def test_compat_splitext():
     assert ('/.bashrc', '') == compat_splitext('/.bashrc')
     assert ('/foo.bar/.bashrc', '') == compat_splitext('/foo.bar/.bashrc')
     assert ('/foo.js', '.js') == compat_splitext('/foo.js.js')
+
+def test_argument_plan():
+    from inspect import getargspec
+    from pecan.util import ArgumentPlan
+
+    def controller(self, id, dummy=None, *args, **kwargs):
+        pass
+
+    plan = ArgumentPlan(getargspec(controller))
+    assert plan.positional == ('id', 'dummy')
+    assert plan.names == frozenset(['self', 'id', 'dummy'])
+    assert plan.defaults == {'dummy': None}
+    assert plan.varargs == True
+    assert plan.varkw == True
+
+    def simple(self):
+        pass
+
+    plan = ArgumentPlan(getargspec(simple))
+    assert plan.positional == ()
+    assert plan.defaults == {}
+    assert plan.varargs == False
+    assert plan.varkw == False